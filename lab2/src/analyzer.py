@@ -0,0 +1,521 @@
+import os
+import time
+import asyncio
+import sqlite3
+import multiprocessing
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import PIL.Image
+
+from image_header import read_header
+from metadata_cache import MetadataCache
+
+
+SUPPORTED_FORMATS = {'.jpg', '.jpeg', '.gif', '.tif', '.tiff', '.bmp', '.png', '.pcx'}
+
+# Bits per pixel of the PIL modes; 0 marks a mode that is not listed.
+MODE_BITS = {'1': 1, 'L': 8, 'P': 8, 'LA': 16, 'PA': 16, 'I;16': 16, 'RGB': 24,
+             'YCbCr': 24, 'LAB': 24, 'HSV': 24, 'RGBA': 32, 'RGBX': 32, 'CMYK': 32,
+             'I': 32, 'F': 32}
+
+
+# Files analysed at once by default: threads mostly wait on I/O, so a few
+# suffice; processes parse headers on their own cores, one per CPU.
+THREAD_CONCURRENCY = 4
+
+
+def default_concurrency(backend):
+    return (os.cpu_count() or 1) if backend == 'process' else THREAD_CONCURRENCY
+
+
+def iter_image_files(folder_path, is_running=lambda: True):
+    # Depth-first os.scandir walk that yields the os.DirEntry of every
+    # supported file as soon as its directory is read. Like os.walk it skips
+    # unreadable directories and does not follow symlinked directories.
+    stack = [folder_path]
+    while stack and is_running():
+        try:
+            with os.scandir(stack.pop()) as it:
+                subdirs = []
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                            continue
+                    except OSError:
+                        continue
+                    if os.path.splitext(entry.name)[1].lower() in SUPPORTED_FORMATS:
+                        yield entry
+        except OSError:
+            continue
+        stack.extend(reversed(subdirs))
+
+
+class Signal:
+    # Minimal stand-in for pyqtSignal so the analyzer works without Qt.
+    # Slots are called directly in the emitting thread; the GUI forwards
+    # them to real Qt signals, which queue across threads.
+    def __init__(self):
+        self.slots = []
+
+    def connect(self, slot):
+        self.slots.append(slot)
+
+    def emit(self, *args):
+        for slot in self.slots:
+            slot(*args)
+
+
+class AsyncImageAnalyzer:
+
+    # The walker hands files over in batches of up to BATCH_SIZE, or sooner
+    # once BATCH_INTERVAL seconds have passed, and may get QUEUE_SIZE
+    # batches ahead of the analysis before it blocks.
+    QUEUE_SIZE = 64
+    BATCH_SIZE = 64
+    BATCH_INTERVAL = 0.01
+    # Minimum interval between live file count updates, in seconds.
+    COUNT_INTERVAL = 0.1
+    # How often a walker blocked on the full queue checks for a stop.
+    PUT_TIMEOUT = 0.1
+    # Finished results and progress reach the GUI at most this often.
+    UPDATE_INTERVAL = 0.1
+    # With the process backend files are sent to workers CHUNK_SIZE at a
+    # time, and each worker may have CHUNKS_PER_WORKER chunks queued.
+    CHUNK_SIZE = 32
+    CHUNKS_PER_WORKER = 2
+
+    def __init__(self, max_concurrency=None, cache_path=None, backend='thread'):
+        self.progress_updated = Signal()
+        self.files_found = Signal()
+        self.results_batch = Signal()
+        self.cache_stats = Signal()
+        self.analysis_finished = Signal()
+        self.error_occurred = Signal()
+        # Seconds from the start of a file's analysis task (for the process
+        # backend, of its chunk) to its result being ready, 0 for cache hits;
+        # only the benchmark listens to it.
+        self.file_latency = Signal()
+        self.is_running = False
+        if max_concurrency is None:
+            max_concurrency = default_concurrency(backend)
+        self.max_concurrency = max(1, max_concurrency)
+        self.cache_path = cache_path
+        self.backend = backend
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        self.walker = ThreadPoolExecutor(max_workers=1)
+
+    def stop_analysis(self):
+        self.is_running = False
+
+    async def analyze_images_async(self, folder_path, show_advanced=False):
+
+        if not os.path.exists(folder_path):
+            self.error_occurred.emit("Папка не існуе")
+            return
+
+        folder_path = os.path.abspath(folder_path)
+        cache = self.open_cache(show_advanced, folder_path)
+        try:
+            await self.run_scan(folder_path, show_advanced, cache)
+        finally:
+            if cache is not None:
+                cache.close()
+
+    def open_cache(self, show_advanced, folder_path):
+        # A cache that cannot be opened (read-only home, corrupt file) just
+        # means every file is analysed.
+        if self.cache_path is None:
+            return None
+        try:
+            cache = MetadataCache(self.cache_path)
+            cache.begin_scan(show_advanced, folder_path)
+            return cache
+        except sqlite3.Error:
+            return None
+
+    async def run_scan(self, folder_path, show_advanced, cache):
+        loop = asyncio.get_event_loop()
+        queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        found = 0
+        walk_done = False
+
+        # Producer: walks the tree on its own thread and hands every file to
+        # the event loop. queue.put blocks the walker while the queue is
+        # full, so a huge tree is never held in memory as a whole list.
+        # With a cache, the walker also stats each file and attaches the
+        # cached result when size and mtime are unchanged. Every file gets
+        # its position in the walk, which is the order results are sent in.
+        # After a stop (Ctrl-C, or the loop closing under it) nothing may
+        # take from the queue any more, so the wait gives up; returns whether
+        # the batch was handed over.
+        def put(batch):
+            coro = queue.put(batch)
+            try:
+                future = asyncio.run_coroutine_threadsafe(coro, loop)
+            except RuntimeError:
+                coro.close()
+                return False
+            while True:
+                try:
+                    future.result(timeout=self.PUT_TIMEOUT)
+                    return True
+                except concurrent.futures.TimeoutError:
+                    if not self.is_running or loop.is_closed():
+                        future.cancel()
+                        return False
+                except concurrent.futures.CancelledError:
+                    return False
+
+        def walk():
+            nonlocal found
+            last_emit = last_put = 0.0
+            batch = []
+            try:
+                for index, entry in enumerate(iter_image_files(folder_path, lambda: self.is_running)):
+                    item = (index, entry.path, None, None)
+                    if cache is not None:
+                        try:
+                            st = entry.stat()
+                            key = (st.st_size, st.st_mtime_ns)
+                            item = (index, entry.path, key, cache.lookup(entry.path, *key))
+                        except OSError:
+                            pass
+                    batch.append(item)
+                    now = time.monotonic()
+                    if len(batch) >= self.BATCH_SIZE or now - last_put >= self.BATCH_INTERVAL:
+                        found += len(batch)
+                        put(batch)
+                        batch = []
+                        last_put = now
+                    if now - last_emit >= self.COUNT_INTERVAL:
+                        self.files_found.emit(found, False)
+                        last_emit = now
+            finally:
+                if batch:
+                    found += len(batch)
+                    put(batch)
+                put(None)
+
+        walk_future = self.walker.submit(walk)
+        walker = asyncio.wrap_future(walk_future)
+        self.progress_updated.emit(0, 0, "Пачатак аналізу...")
+
+        completed = 0
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        in_flight = set()
+        if self.backend == 'process':
+            semaphore = asyncio.Semaphore(self.max_concurrency * self.CHUNKS_PER_WORKER)
+            # Workers are spawned, not forked: this process already runs the
+            # walker and executor threads (and Qt in the GUI), whose locks a
+            # forked child could inherit held.
+            pool = ProcessPoolExecutor(max_workers=self.max_concurrency,
+                                       mp_context=multiprocessing.get_context("spawn"))
+        pending = []
+        last_file = ""
+        sent_any = False
+        # Results finished ahead of an earlier file wait in `ready`, keyed by
+        # their position in the walk, so they are sent in walk order whatever
+        # order the analyses finish in. It holds at most the results queued
+        # behind the oldest unfinished file.
+        ready = {}
+        next_index = 0
+
+        # Results are only kept until they are sent; the GUI model holds them
+        # in compact form, so nothing here grows with the size of the tree.
+        def publish(index, file_path, result, started):
+            nonlocal completed, last_file, next_index
+            self.file_latency.emit(time.perf_counter() - started)
+            ready[index] = (file_path, result)
+            while next_index in ready:
+                last_file, result = ready.pop(next_index)
+                pending.append(result)
+                next_index += 1
+                completed += 1
+            if not sent_any:
+                send_updates()
+
+        # Results are collected in `pending` and sent as one results_batch
+        # signal per UPDATE_INTERVAL together with a single progress update,
+        # instead of two signals per file. The very first result is sent
+        # right away so the table fills as soon as possible.
+        def send_updates():
+            nonlocal pending, sent_any
+            if not pending or not self.is_running:
+                return
+            self.results_batch.emit(pending)
+            pending = []
+            sent_any = True
+            progress = int(completed / found * 100) if walk_done else 0
+            self.progress_updated.emit(progress, completed, os.path.basename(last_file))
+
+        async def send_periodically():
+            while True:
+                await asyncio.sleep(self.UPDATE_INTERVAL)
+                send_updates()
+
+        sender = asyncio.ensure_future(send_periodically())
+
+        async def run(index, file_path, key):
+            started = time.perf_counter()
+            try:
+                result = await self.analyze_single_image(file_path, show_advanced)
+                if key is not None:
+                    cache.store(file_path, *key, result)
+            except Exception as e:
+                result = self.error_result(file_path, e)
+            finally:
+                semaphore.release()
+            publish(index, file_path, result, started)
+
+        async def run_chunk(chunk):
+            started = time.perf_counter()
+            try:
+                paths = [file_path for _, file_path, _ in chunk]
+                rows = await loop.run_in_executor(pool, analyze_chunk, paths, show_advanced)
+            except Exception as e:
+                rows = [str(e)] * len(chunk)
+            finally:
+                semaphore.release()
+            for (index, file_path, key), row in zip(chunk, rows):
+                result = result_from_row(file_path, row)
+                if key is not None and not isinstance(row, str):
+                    cache.store(file_path, *key, result)
+                publish(index, file_path, result, started)
+
+        async def submit(task):
+            try:
+                await semaphore.acquire()
+            except asyncio.CancelledError:
+                task.close()
+                raise
+            if not self.is_running:
+                semaphore.release()
+                task.close()
+                return False
+            task = asyncio.ensure_future(task)
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            return True
+
+        try:
+            # Consumer: the semaphore bounds the work in flight (files for
+            # the thread backend, chunks for the process backend); a slot is
+            # taken before a task is created and given back when it ends.
+            while self.is_running:
+                batch = await queue.get()
+                if batch is None:
+                    walk_done = True
+                    self.files_found.emit(found, True)
+                    break
+                misses = []
+                for index, file_path, key, cached in batch:
+                    if cached is not None:
+                        publish(index, file_path, cached, time.perf_counter())
+                    else:
+                        misses.append((index, file_path, key))
+                if self.backend == 'process':
+                    for start in range(0, len(misses), self.CHUNK_SIZE):
+                        if not await submit(run_chunk(misses[start:start + self.CHUNK_SIZE])):
+                            break
+                else:
+                    for index, file_path, key in misses:
+                        if not await submit(run(index, file_path, key)):
+                            break
+                # queue.get does not yield while batches are waiting, so let
+                # the sender and finished analyses run between batches.
+                await asyncio.sleep(0)
+
+            # On stop the walker may be blocked on a full queue; drain it so
+            # the walker sees is_running and finishes. It may also have given
+            # up on handing over its end marker.
+            while not walk_done:
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait([getter, walker], return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    walk_done = getter.result() is None
+                else:
+                    getter.cancel()
+                    walk_done = True
+            await walker
+
+            if in_flight:
+                await asyncio.gather(*in_flight)
+        except (asyncio.CancelledError, KeyboardInterrupt):
+            # The task is being torn down (e.g. asyncio.run after Ctrl-C):
+            # stop the walker and wait for its thread here, while the loop
+            # still exists, instead of leaving it blocked on the queue.
+            self.is_running = False
+            walk_future.result()
+            raise
+        finally:
+            sender.cancel()
+            if self.backend == 'process':
+                pool.shutdown(wait=False)
+        send_updates()
+
+        if cache is not None:
+            # Rows of deleted files are only pruned after a complete walk.
+            if self.is_running:
+                await loop.run_in_executor(self.walker, cache.prune, folder_path)
+            self.cache_stats.emit(cache.hits, cache.misses)
+
+        if self.is_running:
+            self.analysis_finished.emit(completed)
+
+    @staticmethod
+    def error_result(file_path, error):
+        return {
+            'filename': os.path.basename(file_path),
+            'size': 'Памылка',
+            'dpi': 'Памылка',
+            'color_depth': 'Памылка',
+            'compression': 'Памылка',
+            'format': 'Памылка',
+            'advanced': f'Памылка: {str(error)}',
+            'width': -1,
+            'height': -1,
+            'dpi_x': 0.0,
+            'dpi_y': 0.0,
+            'bit_depth': 0,
+            'error': str(error),
+            'file_path': file_path
+        }
+
+    async def analyze_single_image(self, file_path, show_advanced):
+
+        loop = asyncio.get_event_loop()
+
+        return await loop.run_in_executor(self.executor, self.analyze_file,
+                                          file_path, show_advanced)
+
+    # The analysis itself needs no analyzer state, so it is made of static
+    # methods that worker processes can call as well.
+    @staticmethod
+    def analyze_file(file_path, show_advanced):
+        header = read_header(file_path)
+        if header is not None:
+            return AsyncImageAnalyzer.build_result(file_path, header, show_advanced)
+        with PIL.Image.open(file_path) as img:
+            return AsyncImageAnalyzer.build_result(file_path, img, show_advanced)
+
+    @staticmethod
+    def build_result(file_path, img, show_advanced):
+        # `img` is either an ImageHeader or an open PIL image; both expose
+        # width, height, format, mode and info.
+        filename = os.path.basename(file_path)
+        size = f"{img.width} × {img.height}"
+        format_type = img.format
+
+        dpi = img.info.get('dpi', (0, 0))
+        dpi_str = f"{dpi[0]} × {dpi[1]}" if dpi != (0, 0) else "-"
+
+        color_depth = AsyncImageAnalyzer.get_color_depth(img)
+        compression = AsyncImageAnalyzer.get_compression_info(img)
+        advanced_info = AsyncImageAnalyzer.get_color_system_info(img) if show_advanced else ""
+
+        return {
+            'filename': filename,
+            'size': size,
+            'dpi': dpi_str,
+            'color_depth': color_depth,
+            'compression': compression,
+            'format': format_type,
+            'advanced': advanced_info,
+            'width': img.width,
+            'height': img.height,
+            'dpi_x': float(dpi[0]),
+            'dpi_y': float(dpi[1]),
+            'bit_depth': MODE_BITS.get(img.mode, 0),
+            'file_path': file_path
+        }
+
+    @staticmethod
+    def get_color_depth(img):
+
+        if img.mode in ['1']:
+            return "1 біт (ч/б)"
+        elif img.mode in ['L']:
+            return "8 біт (адценні шэрага)"
+        elif img.mode in ['P']:
+            return "8 біт (палітра)"
+        elif img.mode in ['RGB']:
+            return "24 біты (True Color)"
+        elif img.mode in ['RGBA']:
+            return "32 біты (True Color + Alpha)"
+        elif img.mode in ['CMYK']:
+            return "32 біты (CMYK)"
+        else:
+            return f"{img.mode} (спецыяльны)"
+
+    @staticmethod
+    def get_compression_info(img):
+
+        compression = img.info.get('compression', '-')
+
+        if compression == 'jpeg':
+            quality = img.info.get('quality', 'Не пазначана')
+            return f"JPEG (якасць: {quality})" if quality != '-' else "JPEG"
+        elif compression == 'tiff_lzw':
+            return "LZW (TIFF)"
+        elif compression == 'tiff_ccitt':
+            return "CCITT (TIFF)"
+        elif compression == 'zip':
+            return "ZIP (PNG)"
+        elif compression == 'packbits':
+            return "PackBits (TIFF)"
+        else:
+            return str(compression)
+
+    @staticmethod
+    def get_color_system_info(img):
+        try:
+            if img.mode == 'RGB':
+                color_info = "RGB"
+            elif img.mode == 'RGBA':
+                color_info = "RGBA"
+            elif img.mode == 'CMYK':
+                color_info = "CMYK"
+            elif img.mode == 'L':
+                color_info = "L (Адценні шэрага)"
+            elif img.mode == 'P':
+                color_info = "P (Палітра)"
+            elif img.mode == '1':
+                color_info = "1 (Чорна-белы)"
+            else:
+                color_info = f"{img.mode}"
+
+            if hasattr(img, 'info') and 'icc_profile' in img.info:
+                color_info += " ICC профіль"
+
+            return color_info
+        except Exception as e:
+            return f"Памылка: {str(e)}"
+
+
+# Fields a worker process sends back for each file, in this order; the file
+# name and path are known to the parent already.
+RESULT_FIELDS = ('size', 'dpi', 'color_depth', 'compression', 'format', 'advanced',
+                 'width', 'height', 'dpi_x', 'dpi_y', 'bit_depth')
+
+
+def analyze_chunk(file_paths, show_advanced):
+    # Runs in a worker process. Returns one tuple of RESULT_FIELDS per file,
+    # or the error message for files that could not be analysed.
+    rows = []
+    for file_path in file_paths:
+        try:
+            result = AsyncImageAnalyzer.analyze_file(file_path, show_advanced)
+            rows.append(tuple(result[field] for field in RESULT_FIELDS))
+        except Exception as e:
+            rows.append(str(e))
+    return rows
+
+
+def result_from_row(file_path, row):
+    if isinstance(row, str):
+        return AsyncImageAnalyzer.error_result(file_path, row)
+    result = dict(zip(RESULT_FIELDS, row))
+    result['filename'] = os.path.basename(file_path)
+    result['file_path'] = file_path
+    return result
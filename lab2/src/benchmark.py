@@ -0,0 +1,309 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import platform
+import subprocess
+import tempfile
+import PIL.Image
+
+from analyzer import AsyncImageAnalyzer
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Synthetic trees are described by a small JSON file in their root; a tree
+# with the same parameters is reused instead of being written again, any
+# other tree with this file is deleted first. The file is written before
+# the tree (and rewritten at the end), so an interrupted run is cleaned up
+# too, and a non-empty directory without it is never touched.
+TREE_INFO = ".benchmark_tree.json"
+
+FORMAT_EXTENSIONS = {'jpeg': '.jpg', 'png': '.png', 'tiff': '.tif', 'gif': '.gif',
+                     'bmp': '.bmp', 'pcx': '.pcx'}
+DEFAULT_MIX = "jpeg=6,png=2,tiff=1,gif=1,bmp=1,pcx=1"
+# (width, height, mode) of the template images written for every format.
+TEMPLATE_SHAPES = [(320, 240, 'RGB'), (1024, 768, 'RGB'), (640, 480, 'L'), (800, 600, 'P')]
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip().lower()
+        if name not in FORMAT_EXTENSIONS:
+            raise SystemExit(f"Невядомы фармат: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def encode_template(fmt, width, height, mode, rng):
+    # A noisy gradient, so compressed formats produce realistic sizes.
+    img = PIL.Image.linear_gradient('L').resize((width, height))
+    img = PIL.Image.merge('RGB', (img, img.transpose(PIL.Image.FLIP_LEFT_RIGHT),
+                                  PIL.Image.effect_noise((width, height), rng.uniform(10, 60))))
+    if mode == 'L':
+        img = img.convert('L')
+    elif mode == 'P' or fmt == 'gif':
+        img = img.convert('P', palette=PIL.Image.ADAPTIVE)
+    if fmt == 'pcx' and img.mode not in ('1', 'L', 'P', 'RGB'):
+        img = img.convert('RGB')
+    options = {'dpi': (rng.choice([72, 96, 300]),) * 2} if fmt in ('jpeg', 'png', 'tiff') else {}
+    if fmt == 'tiff':
+        options['compression'] = rng.choice(['raw', 'tiff_lzw', 'packbits'])
+    if fmt == 'jpeg':
+        options['quality'] = rng.choice([75, 90])
+        if img.mode == 'P':
+            img = img.convert('RGB')
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt.upper(), **options)
+    return buffer.getvalue()
+
+
+def corrupt(data, rng):
+    # Either a file cut off inside its header or random bytes.
+    if rng.random() < 0.5:
+        return data[:rng.randint(1, 24)]
+    return bytes(rng.getrandbits(8) for _ in range(256))
+
+
+def leaf_directories(root, depth, fanout):
+    dirs = [root]
+    for level in range(depth):
+        dirs = [os.path.join(d, f"d{level}_{i}") for d in dirs for i in range(fanout)]
+    return dirs
+
+
+def generate_tree(root, files, depth=3, fanout=4, mix=DEFAULT_MIX, corrupt_ratio=0.02, seed=0):
+    params = {"files": files, "depth": depth, "fanout": fanout, "mix": mix,
+              "corrupt_ratio": corrupt_ratio, "seed": seed}
+    info_path = os.path.join(root, TREE_INFO)
+    try:
+        with open(info_path, encoding="utf-8") as f:
+            if json.load(f) == params:
+                return False
+    except (OSError, ValueError):
+        pass
+
+    if os.path.isdir(root) and os.listdir(root):
+        if not os.path.exists(info_path):
+            raise SystemExit(f"Каталог {root} не пусты і не створаны гэтым скрыптам")
+        shutil.rmtree(root)
+    os.makedirs(root, exist_ok=True)
+    with open(info_path, "w", encoding="utf-8") as f:
+        json.dump({"incomplete": True}, f)
+
+    rng = random.Random(seed)
+    weights = parse_mix(mix)
+    formats = list(weights)
+    templates = {fmt: [encode_template(fmt, w, h, mode, rng) for w, h, mode in TEMPLATE_SHAPES]
+                 for fmt in formats}
+    dirs = leaf_directories(root, depth, fanout)
+    for d in dirs:
+        os.makedirs(d, exist_ok=True)
+
+    for i in range(files):
+        fmt = rng.choices(formats, weights=[weights[f] for f in formats])[0]
+        data = rng.choice(templates[fmt])
+        if rng.random() < corrupt_ratio:
+            data = corrupt(data, rng)
+        path = os.path.join(dirs[i % len(dirs)], f"img_{i:07d}{FORMAT_EXTENSIONS[fmt]}")
+        with open(path, "wb") as f:
+            f.write(data)
+
+    with open(info_path, "w", encoding="utf-8") as f:
+        json.dump(params, f)
+    return True
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def peak_rss():
+    # Peak resident set size in bytes of this process and of its finished
+    # children (process pool workers), where the platform reports it.
+    if resource is None:
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return own, children
+
+
+def measure(root, workers, backend, show_advanced=False, cache_path=None):
+    # One headless scan of `root`; meant to run in a fresh process so that
+    # peak RSS belongs to this configuration alone.
+    analyzer = AsyncImageAnalyzer(workers, cache_path, backend)
+    latencies = []
+    state = {"count": 0, "first": None, "errors": 0}
+    start = time.perf_counter()
+
+    def on_batch(results):
+        if state["first"] is None:
+            state["first"] = time.perf_counter() - start
+        state["count"] += len(results)
+        state["errors"] += sum(1 for r in results if 'error' in r)
+
+    analyzer.results_batch.connect(on_batch)
+    analyzer.file_latency.connect(latencies.append)
+    analyzer.is_running = True
+    asyncio.run(analyzer.analyze_images_async(root, show_advanced))
+    elapsed = time.perf_counter() - start
+    analyzer.executor.shutdown()
+    analyzer.walker.shutdown()
+
+    latencies.sort()
+    rss = peak_rss()
+    return {
+        "backend": backend, "workers": workers, "files": state["count"],
+        "errors": state["errors"], "seconds": elapsed,
+        "files_per_s": state["count"] / elapsed if elapsed > 0 else None,
+        "first_result_s": state["first"],
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000 if latencies else None,
+            "p90": percentile(latencies, 90) * 1000 if latencies else None,
+            "p99": percentile(latencies, 99) * 1000 if latencies else None,
+            "max": latencies[-1] * 1000 if latencies else None,
+        },
+        "peak_rss": rss[0] if rss else None,
+        "peak_rss_children": rss[1] if rss else None,
+    }
+
+
+def run_child(args, workers, backend, cache_path):
+    command = [sys.executable, os.path.abspath(__file__), "measure", args.root,
+               "--workers", str(workers), "--backend", backend]
+    if args.advanced:
+        command.append("--advanced")
+    if cache_path:
+        command += ["--cache-path", cache_path]
+    output = subprocess.run(command, check=True, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def print_header():
+    print(f"{'Пул':<8} {'N':>3} {'Файлаў':>8} {'Памыл.':>6} {'Час, с':>8} {'Файл/с':>9} "
+          f"{'1-шы, мс':>9} {'p50, мс':>8} {'p90, мс':>8} {'p99, мс':>8} {'RSS, МБ':>8}")
+
+
+def print_record(r):
+    def ms(value):
+        return f"{value:>8.2f}" if value is not None else f"{'-':>8}"
+    rss = r["peak_rss"]
+    if rss is not None and r["peak_rss_children"]:
+        rss += r["peak_rss_children"]
+    first = r["first_result_s"] * 1000 if r["first_result_s"] is not None else None
+    print(f"{r['backend']:<8} {r['workers']:>3} {r['files']:>8} {r['errors']:>6} "
+          f"{r['seconds']:>8.2f} {r['files_per_s'] or 0:>9.0f} {ms(first):>9} "
+          f"{ms(r['latency_ms']['p50'])} {ms(r['latency_ms']['p90'])} {ms(r['latency_ms']['p99'])} "
+          f"{rss / 2**20 if rss is not None else float('nan'):>8.1f}")
+
+
+def sweep(args):
+    if args.generate:
+        print(f"Стварэнне дрэва ў {args.root}...")
+        created = generate_tree(args.root, args.files, args.depth, args.fanout, args.mix,
+                                args.corrupt, args.seed)
+        print("Дрэва створана" if created else "Выкарыстоўваецца існае дрэва")
+
+    workers = [int(w) for w in args.workers.split(",")]
+    backends = [b.strip() for b in args.backends.split(",")]
+    records = []
+    print_header()
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in backends:
+            for n in workers:
+                cache_path = None
+                if args.cache:
+                    # Warm cache: one priming scan, then the measured ones.
+                    cache_path = os.path.join(tmp, f"{backend}_{n}.sqlite3")
+                    run_child(args, n, backend, cache_path)
+                for _ in range(args.repeat):
+                    record = run_child(args, n, backend, cache_path)
+                    record["cache"] = bool(args.cache)
+                    records.append(record)
+                    print_record(record)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"root": os.path.abspath(args.root), "advanced": args.advanced,
+                       "python": platform.python_version(), "platform": platform.platform(),
+                       "cpu_count": os.cpu_count(),
+                       "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "records": records}, f, ensure_ascii=False, indent=1)
+        print(f"\nВынікі захаваны ў {args.output}")
+
+    best = max(records, key=lambda r: r["files_per_s"] or 0, default=None)
+    if best:
+        print(f"\nНайлепш: {best['backend']}, {best['workers']} ({best['files_per_s']:.0f} файл/с)")
+
+
+def add_tree_options(parser):
+    parser.add_argument("--files", type=int, default=10000, help="колькасць файлаў у дрэве")
+    parser.add_argument("--depth", type=int, default=3, help="глыбіня дрэва каталогаў")
+    parser.add_argument("--fanout", type=int, default=4, help="колькасць падкаталогаў у кожным")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help=f"доля фарматаў (па змаўчанні {DEFAULT_MIX})")
+    parser.add_argument("--corrupt", type=float, default=0.02, help="доля пашкоджаных файлаў")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузачнае тэставанне аналізатара выяў")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="стварыць сінтэтычнае дрэва файлаў")
+    generate.add_argument("root")
+    add_tree_options(generate)
+
+    run = commands.add_parser("run", help="вымераць аналіз пры розных наладах")
+    run.add_argument("root")
+    run.add_argument("--generate", action="store_true",
+                     help="спачатку стварыць дрэва (параметры як у generate)")
+    add_tree_options(run)
+    run.add_argument("--workers", default="1,2,4,8,16",
+                     help="колькасці патокаў/працэсаў праз коску")
+    run.add_argument("--backends", default="thread,process", help="thread, process або абодва")
+    run.add_argument("--repeat", type=int, default=1, help="колькасць замераў кожнай налады")
+    run.add_argument("--advanced", action="store_true", help="рэжым колернай сістэмы")
+    run.add_argument("--cache", action="store_true",
+                     help="вымяраць з цёплым кэшам метаданых")
+    run.add_argument("--output", default=None, help="JSON файл для вынікаў")
+
+    child = commands.add_parser("measure", help=argparse.SUPPRESS)
+    child.add_argument("root")
+    child.add_argument("--workers", type=int, default=4)
+    child.add_argument("--backend", default="thread")
+    child.add_argument("--advanced", action="store_true")
+    child.add_argument("--cache-path", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "generate":
+        created = generate_tree(args.root, args.files, args.depth, args.fanout, args.mix,
+                                args.corrupt, args.seed)
+        print("Дрэва створана" if created else "Дрэва з такімі параметрамі ўжо існуе")
+    elif args.command == "run":
+        sweep(args)
+    else:
+        print(json.dumps(measure(args.root, args.workers, args.backend,
+                                 args.advanced, args.cache_path)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import os
+import sys
+import time
+import signal
+import asyncio
+import argparse
+
+from analyzer import AsyncImageAnalyzer
+from metadata_cache import DEFAULT_CACHE_PATH
+from export import open_exporter
+
+
+# Importing this module (and running it) never touches PyQt5, so it works on
+# servers without a display.
+
+# 'ndjson' is kept as another name for JSON Lines.
+FORMATS = {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl', 'parquet': 'parquet'}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Аналіз графічных файлаў папкі без графічнага інтэрфейсу")
+    parser.add_argument("folder", help="папка з выявамі")
+    parser.add_argument("--format", choices=sorted(FORMATS),
+                        help="фармат вываду (па змаўчанні па пашырэнні --output, для stdout - ndjson)")
+    parser.add_argument("--output", "-o", default="-",
+                        help="файл для вынікаў ('-' - стандартны вывад; parquet - толькі ў файл)")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="колькасць файлаў (патокаў або працэсаў), якія аналізуюцца адначасова "
+                             "(па змаўчанні 4 патокі або па працэсе на ядро)")
+    parser.add_argument("--backend", choices=['thread', 'process'], default='thread',
+                        help="пул патокаў або пул працэсаў")
+    parser.add_argument("--advanced", action="store_true",
+                        help="дадаваць інфармацыю пра колерную сістэму")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="не выкарыстоўваць кэш метаданых")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH,
+                        help="шлях да базы кэша метаданых")
+    parser.add_argument("--quiet", "-q", action="store_true",
+                        help="не выводзіць ход аналізу ў stderr")
+    return parser.parse_args(argv)
+
+
+def run(args, exporter):
+    analyzer = AsyncImageAnalyzer(args.concurrency,
+                                  None if args.no_cache else args.cache_path,
+                                  args.backend)
+    errors = []
+    summary = {}
+
+    analyzer.results_batch.connect(exporter.write)
+    analyzer.error_occurred.connect(errors.append)
+    analyzer.cache_stats.connect(lambda hits, misses: summary.update(hits=hits, misses=misses))
+    analyzer.analysis_finished.connect(lambda count: summary.update(count=count))
+    if not args.quiet:
+        analyzer.progress_updated.connect(
+            lambda progress, current, filename: print(
+                f"\r{current} файлаў ({progress}%)", end="", file=sys.stderr, flush=True))
+
+    # The first Ctrl-C stops the scan the way the GUI's stop button does, so
+    # the walker and workers wind down and the export stays consistent; a
+    # second one interrupts whatever is still running.
+    interrupted = []
+
+    def on_interrupt(signum, frame):
+        if interrupted:
+            raise KeyboardInterrupt
+        interrupted.append(signum)
+        analyzer.stop_analysis()
+
+    analyzer.is_running = True
+    start = time.perf_counter()
+    previous = signal.signal(signal.SIGINT, on_interrupt)
+    try:
+        asyncio.run(analyzer.analyze_images_async(args.folder, args.advanced))
+    except KeyboardInterrupt:
+        analyzer.stop_analysis()
+        interrupted.append(signal.SIGINT)
+    finally:
+        signal.signal(signal.SIGINT, previous)
+    if interrupted:
+        print("\nАналіз перапынены", file=sys.stderr)
+        return 130
+    elapsed = time.perf_counter() - start
+
+    for error in errors:
+        print(f"Памылка: {error}", file=sys.stderr)
+    if errors:
+        return 1
+    if not args.quiet:
+        line = f"\rАпрацавана файлаў: {summary.get('count', 0)} за {elapsed:.1f} с"
+        if 'hits' in summary:
+            line += f" (кэш: трапленняў {summary['hits']}, промахаў {summary['misses']})"
+        print(line, file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    export_format = FORMATS.get(args.format)
+    if args.output == "-":
+        try:
+            with open_exporter(None, export_format or 'jsonl', sys.stdout) as exporter:
+                return run(args, exporter)
+        except BrokenPipeError:
+            # The reader (e.g. `head`) went away; silence the final flush.
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return 1
+        except (RuntimeError, ValueError) as e:
+            print(f"Памылка: {e}", file=sys.stderr)
+            return 2
+    try:
+        exporter = open_exporter(args.output, export_format)
+    except (OSError, RuntimeError) as e:
+        print(f"Памылка: {e}", file=sys.stderr)
+        return 2
+    with exporter:
+        return run(args, exporter)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
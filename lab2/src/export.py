@@ -0,0 +1,150 @@
+import os
+import csv
+import json
+
+
+# Exported columns and their types. Numbers are written as numbers; values
+# that are unknown (no DPI in the file, unlisted mode, unreadable file) are
+# written as empty/null instead of the table's display strings.
+EXPORT_FIELDS = [
+    ('file_path', 'str'),
+    ('filename', 'str'),
+    ('format', 'str'),
+    ('width', 'int'),
+    ('height', 'int'),
+    ('dpi_x', 'float'),
+    ('dpi_y', 'float'),
+    ('bit_depth', 'int'),
+    ('color_depth', 'str'),
+    ('compression', 'str'),
+    ('advanced', 'str'),
+    ('error', 'str'),
+]
+FIELD_NAMES = [name for name, _ in EXPORT_FIELDS]
+
+
+def export_record(result):
+    error = result.get('error')
+    failed = error is not None
+    dpi_known = result.get('dpi_x') or result.get('dpi_y')
+    return {
+        'file_path': result['file_path'],
+        'filename': result['filename'],
+        'format': None if failed else result['format'],
+        'width': None if failed else result['width'],
+        'height': None if failed else result['height'],
+        'dpi_x': result['dpi_x'] if dpi_known else None,
+        'dpi_y': result['dpi_y'] if dpi_known else None,
+        'bit_depth': result.get('bit_depth') or None,
+        'color_depth': None if failed else result['color_depth'],
+        'compression': None if failed else result['compression'],
+        'advanced': None if failed else result['advanced'],
+        'error': error,
+    }
+
+
+class Exporter:
+    # Results are written batch by batch as the scan produces them, so the
+    # file grows during the scan and nothing is kept in memory. Text formats
+    # can also write to an already open `stream` (e.g. stdout), which is
+    # flushed but not closed.
+    def __init__(self, path, stream=None):
+        self.path = path
+        self.count = 0
+        self.stream = stream
+
+    def write(self, results):
+        self.write_records([export_record(result) for result in results])
+        self.count += len(results)
+
+    def write_records(self, records):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CsvExporter(Exporter):
+    def __init__(self, path, stream=None):
+        super().__init__(path, stream)
+        self.file = stream or open(path, 'w', encoding='utf-8', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=FIELD_NAMES)
+        self.writer.writeheader()
+
+    def write_records(self, records):
+        self.writer.writerows(records)
+        self.file.flush()
+
+    def close(self):
+        if self.stream is None:
+            self.file.close()
+
+
+class JsonLinesExporter(Exporter):
+    def __init__(self, path, stream=None):
+        super().__init__(path, stream)
+        self.file = stream or open(path, 'w', encoding='utf-8', newline='\n')
+
+    def write_records(self, records):
+        self.file.writelines(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        self.file.flush()
+
+    def close(self):
+        if self.stream is None:
+            self.file.close()
+
+
+class ParquetExporter(Exporter):
+    # Records are gathered into row groups of ROW_GROUP_SIZE rows; each full
+    # group is written out, so memory stays bounded by one group. pyarrow is
+    # optional and only imported here, keeping it out of CSV/JSON runs.
+    ROW_GROUP_SIZE = 65536
+
+    def __init__(self, path, stream=None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Для экспарту ў Parquet патрэбны пакет pyarrow")
+        self.pyarrow = pyarrow
+        if stream is not None:
+            raise ValueError("Parquet можна запісаць толькі ў файл")
+        super().__init__(path)
+        types = {'str': pyarrow.string(), 'int': pyarrow.int64(), 'float': pyarrow.float64()}
+        self.schema = pyarrow.schema([(name, types[kind]) for name, kind in EXPORT_FIELDS])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        self.rows = []
+
+    def write_records(self, records):
+        self.rows.extend(records)
+        if len(self.rows) >= self.ROW_GROUP_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            table = self.pyarrow.Table.from_pylist(self.rows, schema=self.schema)
+            self.writer.write_table(table)
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+EXPORTERS = {'csv': CsvExporter, 'jsonl': JsonLinesExporter, 'parquet': ParquetExporter}
+EXTENSIONS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'jsonl',
+              '.parquet': 'parquet'}
+
+
+def format_from_path(path):
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower(), 'csv')
+
+
+def open_exporter(path, export_format=None, stream=None):
+    return EXPORTERS[export_format or format_from_path(path)](path, stream)
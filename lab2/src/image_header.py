@@ -0,0 +1,425 @@
+import io
+import struct
+
+
+# Reads size, mode, DPI, compression and ICC presence straight from the file
+# headers, without going through PIL.Image.open. The values mirror what
+# Pillow would put into Image.size/mode/format/info for the same file, so
+# the analyzer's formatting code works on either object. Anything the
+# reader does not fully understand makes read_header() return None and the
+# caller falls back to Pillow.
+
+
+class UnsupportedHeader(Exception):
+    pass
+
+
+class ImageHeader:
+    __slots__ = ('format', 'width', 'height', 'mode', 'info')
+
+    def __init__(self, format, width, height, mode, info=None):
+        self.format = format
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.info = info if info is not None else {}
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+
+def read_header(file_path):
+    with open(file_path, 'rb') as f:
+        prefix = f.read(16)
+        f.seek(0)
+        try:
+            for accept, parse in _PARSERS:
+                if accept(prefix):
+                    return parse(f)
+        except (UnsupportedHeader, struct.error, IndexError):
+            return None
+    return None
+
+
+def _read(f, n):
+    data = f.read(n)
+    if len(data) != n:
+        raise UnsupportedHeader("truncated header")
+    return data
+
+
+def _u16be(data, offset=0):
+    return struct.unpack_from('>H', data, offset)[0]
+
+
+def _u16le(data, offset=0):
+    return struct.unpack_from('<H', data, offset)[0]
+
+
+def _u32be(data, offset=0):
+    return struct.unpack_from('>I', data, offset)[0]
+
+
+def _u32le(data, offset=0):
+    return struct.unpack_from('<I', data, offset)[0]
+
+
+# ---------------------------------------------------------------- JPEG
+
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_JPEG_MODES = {1: 'L', 3: 'RGB', 4: 'CMYK'}
+
+
+def _parse_jpeg(f):
+    _read(f, 2)
+    info = {}
+    size = mode = exif = None
+
+    while True:
+        byte = _read(f, 1)
+        if byte != b'\xff':
+            continue
+        marker = _read(f, 1)[0]
+        while marker == 0xFF:
+            marker = _read(f, 1)[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            continue
+        if marker == 0xD9:
+            raise UnsupportedHeader("no image data")
+        length = _u16be(_read(f, 2)) - 2
+
+        if marker == 0xDA:
+            break
+        if marker in _JPEG_SOF:
+            s = _read(f, length)
+            if s[0] != 8 or s[5] not in _JPEG_MODES:
+                raise UnsupportedHeader("unusual JPEG layout")
+            size = _u16be(s, 3), _u16be(s, 1)
+            mode = _JPEG_MODES[s[5]]
+        elif marker == 0xE0:
+            s = _read(f, length)
+            if s.startswith(b'JFIF') and len(s) >= 12:
+                unit, density = s[7], (_u16be(s, 8), _u16be(s, 10))
+                if unit == 1:
+                    info['dpi'] = density
+                elif unit == 2:
+                    info['dpi'] = tuple(d * 2.54 for d in density)
+        elif marker == 0xE1:
+            s = _read(f, length)
+            if s.startswith(b'Exif\0\0') and exif is None:
+                exif = s[6:]
+        elif marker == 0xE2:
+            s = _read(f, min(length, 12))
+            if s.startswith(b'MPF\0'):
+                # Multi-picture files are reported by Pillow as MPO.
+                raise UnsupportedHeader("MPO")
+            if s.startswith(b'ICC_PROFILE\0'):
+                info['icc_profile'] = True
+            f.seek(length - len(s), io.SEEK_CUR)
+        else:
+            f.seek(length, io.SEEK_CUR)
+
+    if size is None:
+        raise UnsupportedHeader("no SOF marker")
+    if 'dpi' not in info and exif is not None:
+        info['dpi'] = _exif_dpi(exif)
+    return ImageHeader('JPEG', size[0], size[1], mode, info)
+
+
+def _exif_dpi(exif):
+    # Same rules as JpegImageFile._read_dpi_from_exif: 72 dpi whenever the
+    # EXIF resolution is missing or unreadable.
+    try:
+        tags = _read_ifd(io.BytesIO(exif), {282, 296})
+        unit, xres = tags[296][0], tags[282][0]
+    except (UnsupportedHeader, KeyError, IndexError, struct.error):
+        return 72, 72
+    if isinstance(xres, float) and xres != xres:
+        return 72, 72
+    if unit == 3:
+        xres *= 2.54
+    return xres, xres
+
+
+# ---------------------------------------------------------------- PNG
+
+_PNG_MODES = {
+    (1, 0): '1', (2, 0): 'L', (4, 0): 'L', (8, 0): 'L', (16, 0): 'I;16',
+    (8, 2): 'RGB', (16, 2): 'RGB',
+    (1, 3): 'P', (2, 3): 'P', (4, 3): 'P', (8, 3): 'P',
+    (8, 4): 'LA', (16, 4): 'RGBA',
+    (8, 6): 'RGBA', (16, 6): 'RGBA',
+}
+
+
+def _parse_png(f):
+    _read(f, 8)
+    info = {}
+    size = mode = None
+    while True:
+        head = _read(f, 8)
+        length, ctype = _u32be(head), head[4:8]
+        if ctype == b'IHDR':
+            s = _read(f, length)
+            if length < 13 or s[11] or (s[8], s[9]) not in _PNG_MODES:
+                raise UnsupportedHeader("unusual PNG header")
+            size = _u32be(s, 0), _u32be(s, 4)
+            mode = _PNG_MODES[(s[8], s[9])]
+        elif ctype == b'pHYs':
+            s = _read(f, length)
+            if length >= 9 and s[8] == 1:
+                info['dpi'] = _u32be(s, 0) * 0.0254, _u32be(s, 4) * 0.0254
+        elif ctype == b'iCCP':
+            info['icc_profile'] = True
+            f.seek(length, io.SEEK_CUR)
+        elif ctype in (b'IDAT', b'IEND'):
+            break
+        else:
+            f.seek(length, io.SEEK_CUR)
+        f.seek(4, io.SEEK_CUR)
+
+    if size is None:
+        raise UnsupportedHeader("no IHDR chunk")
+    return ImageHeader('PNG', size[0], size[1], mode, info)
+
+
+# ---------------------------------------------------------------- GIF
+
+def _gif_palette_needed(palette):
+    # Pillow drops palettes that are just a grey ramp and reports mode L.
+    for i in range(0, len(palette), 3):
+        if not (i // 3 == palette[i] == palette[i + 1] == palette[i + 2]):
+            return True
+    return False
+
+
+def _parse_gif(f):
+    s = _read(f, 13)
+    width, height = _u16le(s, 6), _u16le(s, 8)
+    flags = s[10]
+    global_palette = False
+    if flags & 128:
+        global_palette = _gif_palette_needed(_read(f, 3 << ((flags & 7) + 1)))
+
+    while True:
+        block = _read(f, 1)
+        if block == b'!':
+            _read(f, 1)
+            while True:
+                n = _read(f, 1)[0]
+                if n == 0:
+                    break
+                f.seek(n, io.SEEK_CUR)
+        elif block == b',':
+            s = _read(f, 9)
+            x1, y1 = _u16le(s, 0) + _u16le(s, 4), _u16le(s, 2) + _u16le(s, 6)
+            width, height = max(x1, width), max(y1, height)
+            palette = global_palette
+            if s[8] & 128:
+                palette = _gif_palette_needed(_read(f, 3 << ((s[8] & 7) + 1)))
+            return ImageHeader('GIF', width, height, 'P' if palette else 'L')
+        elif block == b';':
+            raise UnsupportedHeader("no frames")
+
+
+# ---------------------------------------------------------------- BMP
+
+_BMP_MODES = {1: 'P', 4: 'P', 8: 'P', 16: 'RGB', 24: 'RGB', 32: 'RGB'}
+
+
+def _parse_bmp(f):
+    _read(f, 14)
+    header_size = _u32le(_read(f, 4))
+    s = _read(f, header_size - 4)
+    info = {}
+
+    if header_size == 12:
+        width, height = _u16le(s, 0), _u16le(s, 2)
+        bits, compression, colors, padding = _u16le(s, 6), 0, 0, 3
+    elif header_size in (40, 52, 56, 64, 108, 124):
+        width = _u32le(s, 0)
+        height = _u32le(s, 4) if s[7] != 0xFF else 2**32 - _u32le(s, 4)
+        bits, compression = _u16le(s, 10), _u32le(s, 12)
+        colors, padding = _u32le(s, 28), 4
+        info['dpi'] = tuple(_u32le(s, offset) / 39.3701 for offset in (20, 24))
+    else:
+        raise UnsupportedHeader("unknown BMP header")
+
+    # Bitfield layouts and embedded JPEG/PNG are left to Pillow.
+    if bits not in _BMP_MODES or compression not in (0, 1, 2):
+        raise UnsupportedHeader("unusual BMP layout")
+    mode = _BMP_MODES[bits]
+
+    if mode == 'P':
+        colors = colors or 1 << bits
+        if not 0 < colors <= 65536:
+            raise UnsupportedHeader("bad BMP palette")
+        palette = _read(f, padding * colors)
+        indices = (0, 255) if colors == 2 else range(colors)
+        if all(palette[i * padding:i * padding + 3] == bytes([v]) * 3 for i, v in enumerate(indices)):
+            mode = '1' if colors == 2 else 'L'
+
+    info['compression'] = compression
+    return ImageHeader('BMP', width, height, mode, info)
+
+
+# ---------------------------------------------------------------- PCX
+
+def _parse_pcx(f):
+    s = _read(f, 68)
+    x0, y0, x1, y1 = _u16le(s, 4), _u16le(s, 6), _u16le(s, 8) + 1, _u16le(s, 10) + 1
+    if x1 <= x0 or y1 <= y0:
+        raise UnsupportedHeader("bad PCX size")
+    version, bits, planes = s[1], s[3], s[65]
+    info = {'dpi': (_u16le(s, 12), _u16le(s, 14))}
+
+    if bits == 1 and planes == 1:
+        mode = '1'
+    elif bits == 1 and planes in (2, 4):
+        mode = 'P'
+    elif version == 5 and bits == 8 and planes == 1:
+        # Greyscale vs palette is decided by the 256-colour palette that
+        # trails the pixel data.
+        mode = 'L'
+        f.seek(-769, io.SEEK_END)
+        p = f.read(769)
+        if len(p) == 769 and p[0] == 12:
+            if any(p[i * 3 + 1:i * 3 + 4] != bytes([i]) * 3 for i in range(256)):
+                mode = 'P'
+    elif version == 5 and bits == 8 and planes == 3:
+        mode = 'RGB'
+    else:
+        raise UnsupportedHeader("unknown PCX mode")
+    return ImageHeader('PCX', x1 - x0, y1 - y0, mode, info)
+
+
+# ---------------------------------------------------------------- TIFF
+
+_TIFF_TYPES = {
+    # type: (struct code, size)
+    1: ('B', 1), 2: ('c', 1), 3: ('H', 2), 4: ('I', 4), 5: ('II', 8),
+    6: ('b', 1), 7: ('B', 1), 8: ('h', 2), 9: ('i', 4), 10: ('ii', 8),
+    11: ('f', 4), 12: ('d', 8), 13: ('I', 4),
+}
+
+_TIFF_COMPRESSION = {
+    1: 'raw', 2: 'tiff_ccitt', 3: 'group3', 4: 'group4', 5: 'tiff_lzw',
+    6: 'tiff_jpeg', 7: 'jpeg', 8: 'tiff_adobe_deflate', 32771: 'tiff_raw_16',
+    32773: 'packbits', 32809: 'tiff_thunderscan', 32946: 'tiff_deflate',
+    34676: 'tiff_sgilog', 34677: 'tiff_sgilog24', 34925: 'lzma',
+    50000: 'zstd', 50001: 'webp',
+}
+
+_TIFF_MODES = {
+    # (photometric, bits per sample, extra samples): mode
+    (0, (1,), ()): '1', (1, (1,), ()): '1',
+    (0, (2,), ()): 'L', (1, (2,), ()): 'L',
+    (0, (4,), ()): 'L', (1, (4,), ()): 'L',
+    (0, (8,), ()): 'L', (1, (8,), ()): 'L',
+    (1, (8, 8), (2,)): 'LA',
+    (2, (8, 8, 8), ()): 'RGB',
+    (2, (8, 8, 8, 8), ()): 'RGBA',
+    (2, (8, 8, 8, 8), (0,)): 'RGB',
+    (2, (8, 8, 8, 8), (1,)): 'RGBA',
+    (2, (8, 8, 8, 8), (2,)): 'RGBA',
+    (3, (1,), ()): 'P', (3, (2,), ()): 'P', (3, (4,), ()): 'P', (3, (8,), ()): 'P',
+    (5, (8, 8, 8, 8), ()): 'CMYK',
+}
+
+_TIFF_TAGS = {256, 257, 258, 259, 262, 266, 274, 277, 282, 283, 284, 296, 338, 339, 34675, 0xBC01}
+
+
+def _read_ifd(f, wanted):
+    # Returns {tag: tuple of values} for the `wanted` tags of the first IFD.
+    # Large values (ICC profiles, strip tables) are recorded as present but
+    # not read.
+    head = _read(f, 8)
+    if head[:4] == b'II*\0':
+        order = '<'
+    elif head[:4] == b'MM\0*':
+        order = '>'
+    else:
+        raise UnsupportedHeader("not a TIFF header")
+    f.seek(struct.unpack(order + 'I', head[4:])[0])
+    count = struct.unpack(order + 'H', _read(f, 2))[0]
+    entries = _read(f, 12 * count)
+
+    tags = {}
+    for i in range(count):
+        tag, type_, n, raw = struct.unpack_from(order + 'HHI4s', entries, 12 * i)
+        if tag not in wanted or type_ not in _TIFF_TYPES:
+            continue
+        code, size = _TIFF_TYPES[type_]
+        if tag == 34675 or n * size > 256:
+            tags[tag] = ()
+            continue
+        if n * size <= 4:
+            data = raw
+        else:
+            pos = f.tell()
+            f.seek(struct.unpack(order + 'I', raw)[0])
+            data = _read(f, n * size)
+            f.seek(pos)
+        values = struct.unpack_from(order + code * n, data)
+        if type_ in (5, 10):
+            values = tuple(
+                values[j] / values[j + 1] if values[j + 1] else float('nan')
+                for j in range(0, len(values), 2)
+            )
+        tags[tag] = values
+    return tags
+
+
+def _parse_tiff(f):
+    tags = _read_ifd(f, _TIFF_TAGS)
+    if 0xBC01 in tags or 256 not in tags or 257 not in tags:
+        raise UnsupportedHeader("unusual TIFF")
+
+    compression = tags.get(259, (1,))[0]
+    if compression not in _TIFF_COMPRESSION:
+        raise UnsupportedHeader("unknown TIFF compression")
+    photo = tags.get(262, (0,))[0]
+    if compression == 6:
+        photo = 6
+    if tags.get(266, (1,))[0] != 1 or tags.get(339, (1,))[0] != 1 or tags.get(284, (1,))[0] != 1:
+        raise UnsupportedHeader("unusual TIFF layout")
+
+    bps = tags.get(258, (1,))
+    extra = tags.get(338, ())
+    samples = tags.get(277, (1,))[0]
+    if samples < len(bps):
+        bps = bps[:samples]
+    elif samples > len(bps) and len(bps) == 1:
+        bps = bps * samples
+    mode = _TIFF_MODES.get((photo, tuple(bps), tuple(extra)))
+    if mode is None or len(bps) != samples:
+        raise UnsupportedHeader("unsupported TIFF mode")
+
+    width, height = tags[256][0], tags[257][0]
+    if tags.get(274, (1,))[0] in (5, 6, 7, 8):
+        width, height = height, width
+
+    info = {'compression': _TIFF_COMPRESSION[compression]}
+    xres, yres = tags.get(282, (1,))[0], tags.get(283, (1,))[0]
+    if xres != xres or yres != yres:
+        raise UnsupportedHeader("invalid TIFF resolution")
+    if xres and yres:
+        unit = tags.get(296, (None,))[0]
+        if unit in (2, None):
+            info['dpi'] = xres, yres
+        elif unit == 3:
+            info['dpi'] = xres * 2.54, yres * 2.54
+    if 34675 in tags:
+        info['icc_profile'] = True
+    return ImageHeader('TIFF', width, height, mode, info)
+
+
+_PARSERS = [
+    (lambda p: p[:3] == b'\xff\xd8\xff', _parse_jpeg),
+    (lambda p: p[:8] == b'\x89PNG\r\n\x1a\n', _parse_png),
+    (lambda p: p[:6] in (b'GIF87a', b'GIF89a'), _parse_gif),
+    (lambda p: p[:2] == b'BM', _parse_bmp),
+    (lambda p: len(p) > 1 and p[0] == 10 and p[1] in (0, 2, 3, 5), _parse_pcx),
+    (lambda p: p[:4] in (b'II*\0', b'MM\0*'), _parse_tiff),
+]
@@ -2,199 +2,36 @@ import sys
 import os
 import time
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout,
-                             QWidget, QTableWidget, QTableWidgetItem, QPushButton,
+                             QWidget, QTableView, QPushButton,
                              QFileDialog, QLabel, QProgressBar, QLineEdit,
-                             QHeaderView, QMessageBox, QCheckBox, QGroupBox)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer, QObject
+                             QHeaderView, QMessageBox, QCheckBox, QGroupBox,
+                             QSpinBox, QComboBox)
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtGui import QFont, QPalette, QColor
-import PIL.Image
-from PIL.ExifTags import TAGS
 
-
-class AsyncImageAnalyzer(QObject):
-    progress_updated = pyqtSignal(int, int, str)
-    analysis_finished = pyqtSignal(list)
-    error_occurred = pyqtSignal(str)
-
-    def __init__(self):
-        super().__init__()
-        self.is_running = False
-        self.executor = ThreadPoolExecutor(max_workers=4)
-
-    def stop_analysis(self):
-        self.is_running = False
-
-    async def analyze_images_async(self, folder_path, show_advanced=False):
-
-        if not os.path.exists(folder_path):
-            self.error_occurred.emit("Папка не існуе")
-            return
-
-        supported_formats = {'.jpg', '.jpeg', '.gif', '.tif', '.tiff', '.bmp', '.png', '.pcx'}
-        image_files = []
-
-
-        loop = asyncio.get_event_loop()
-
-        def collect_files():
-            files = []
-            for root, dirs, walk_files in os.walk(folder_path):
-                if not self.is_running:
-                    break
-                for file in walk_files:
-                    ext = os.path.splitext(file)[1].lower()
-                    if ext in supported_formats:
-                        files.append(os.path.join(root, file))
-            return files
-
-        image_files = await loop.run_in_executor(self.executor, collect_files)
-
-        if not self.is_running:
-            return
-
-        total_files = len(image_files)
-        self.progress_updated.emit(0, 0, "Пачатак аналізу...")
-
-        results = []
-
-
-        for i, file_path in enumerate(image_files):
-            if not self.is_running:
-                break
-
-            try:
-
-                result = await self.analyze_single_image(file_path, show_advanced)
-                results.append(result)
-
-                progress = int((i + 1) / total_files * 100) if total_files > 0 else 0
-                self.progress_updated.emit(progress, i + 1, os.path.basename(file_path))
-
-
-                await asyncio.sleep(0.001)
-
-            except Exception as e:
-                error_result = {
-                    'filename': os.path.basename(file_path),
-                    'size': 'Памылка',
-                    'dpi': 'Памылка',
-                    'color_depth': 'Памылка',
-                    'compression': 'Памылка',
-                    'format': 'Памылка',
-                    'advanced': f'Памылка: {str(e)}',
-                    'file_path': file_path
-                }
-                results.append(error_result)
-
-        if self.is_running:
-            self.analysis_finished.emit(results)
-
-    async def analyze_single_image(self, file_path, show_advanced):
-
-        loop = asyncio.get_event_loop()
-
-        def analyze():
-            try:
-                with PIL.Image.open(file_path) as img:
-                    filename = os.path.basename(file_path)
-                    size = f"{img.width} × {img.height}"
-                    format_type = img.format
-
-                    dpi = img.info.get('dpi', (0, 0))
-                    dpi_str = f"{dpi[0]} × {dpi[1]}" if dpi != (0, 0) else "-"
-
-                    color_depth = self.get_color_depth(img)
-                    compression = self.get_compression_info(img)
-                    advanced_info = self.get_color_system_info(img) if show_advanced else ""
-
-                    return {
-                        'filename': filename,
-                        'size': size,
-                        'dpi': dpi_str,
-                        'color_depth': color_depth,
-                        'compression': compression,
-                        'format': format_type,
-                        'advanced': advanced_info,
-                        'file_path': file_path
-                    }
-            except Exception as e:
-                raise e
-
-        return await loop.run_in_executor(self.executor, analyze)
-
-    def get_color_depth(self, img):
-
-        if img.mode in ['1']:
-            return "1 біт (ч/б)"
-        elif img.mode in ['L']:
-            return "8 біт (адценні шэрага)"
-        elif img.mode in ['P']:
-            return "8 біт (палітра)"
-        elif img.mode in ['RGB']:
-            return "24 біты (True Color)"
-        elif img.mode in ['RGBA']:
-            return "32 біты (True Color + Alpha)"
-        elif img.mode in ['CMYK']:
-            return "32 біты (CMYK)"
-        else:
-            return f"{img.mode} (спецыяльны)"
-
-    def get_compression_info(self, img):
-
-        compression = img.info.get('compression', '-')
-
-        if compression == 'jpeg':
-            quality = img.info.get('quality', 'Не пазначана')
-            return f"JPEG (якасць: {quality})" if quality != '-' else "JPEG"
-        elif compression == 'tiff_lzw':
-            return "LZW (TIFF)"
-        elif compression == 'tiff_ccitt':
-            return "CCITT (TIFF)"
-        elif compression == 'zip':
-            return "ZIP (PNG)"
-        elif compression == 'packbits':
-            return "PackBits (TIFF)"
-        else:
-            return str(compression)
-
-    def get_color_system_info(self, img):
-        try:
-            if img.mode == 'RGB':
-                color_info = "RGB"
-            elif img.mode == 'RGBA':
-                color_info = "RGBA"
-            elif img.mode == 'CMYK':
-                color_info = "CMYK"
-            elif img.mode == 'L':
-                color_info = "L (Адценні шэрага)"
-            elif img.mode == 'P':
-                color_info = "P (Палітра)"
-            elif img.mode == '1':
-                color_info = "1 (Чорна-белы)"
-            else:
-                color_info = f"{img.mode}"
-
-            if hasattr(img, 'info') and 'icc_profile' in img.info:
-                color_info += " ICC профіль"
-
-            return color_info
-        except Exception as e:
-            return f"Памылка: {str(e)}"
+from analyzer import AsyncImageAnalyzer, default_concurrency, iter_image_files
+from metadata_cache import DEFAULT_CACHE_PATH
+from export import open_exporter
+from results_model import ResultsTableModel
 
 
 class ImageAnalysisThread(QThread):
     progress_updated = pyqtSignal(int, int, str)
-    analysis_finished = pyqtSignal(list)
+    files_found = pyqtSignal(int, bool)
+    results_batch = pyqtSignal(list)
+    cache_stats = pyqtSignal(int, int)
+    analysis_finished = pyqtSignal(int)
     error_occurred = pyqtSignal(str)
 
-    def __init__(self, folder_path, show_advanced=False):
+    def __init__(self, folder_path, show_advanced=False, max_concurrency=None, cache_path=None,
+                 backend='thread', export_path=None):
         super().__init__()
         self.folder_path = folder_path
         self.show_advanced = show_advanced
+        self.export_path = export_path
         self.is_running = True
-        self.analyzer = AsyncImageAnalyzer()
+        self.analyzer = AsyncImageAnalyzer(max_concurrency, cache_path, backend)
 
     def stop_analysis(self):
         self.is_running = False
@@ -204,10 +41,19 @@ class ImageAnalysisThread(QThread):
 
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
+        exporter = None
 
         try:
+            # The exporter is fed from this thread, batch by batch, so the
+            # file is written while the scan runs without touching the GUI.
+            if self.export_path:
+                exporter = open_exporter(self.export_path)
+                self.analyzer.results_batch.connect(exporter.write)
             self.analyzer.is_running = True
             self.analyzer.progress_updated.connect(self.progress_updated.emit)
+            self.analyzer.files_found.connect(self.files_found.emit)
+            self.analyzer.results_batch.connect(self.results_batch.emit)
+            self.analyzer.cache_stats.connect(self.cache_stats.emit)
             self.analyzer.analysis_finished.connect(self.analysis_finished.emit)
             self.analyzer.error_occurred.connect(self.error_occurred.emit)
 
@@ -218,16 +64,43 @@ class ImageAnalysisThread(QThread):
         except Exception as e:
             self.error_occurred.emit(f"Памылка аналізу: {str(e)}")
         finally:
+            if exporter is not None:
+                exporter.close()
             loop.close()
             self.analyzer.is_running = False
 
 
+class FileCountThread(QThread):
+    count_updated = pyqtSignal(int, bool)
+
+    def __init__(self, folder_path):
+        super().__init__()
+        self.folder_path = folder_path
+        self.is_running = True
+
+    def stop(self):
+        self.is_running = False
+
+    def run(self):
+        count = 0
+        last_emit = 0.0
+        for _ in iter_image_files(self.folder_path, lambda: self.is_running):
+            count += 1
+            now = time.monotonic()
+            if now - last_emit >= AsyncImageAnalyzer.COUNT_INTERVAL:
+                self.count_updated.emit(count, False)
+                last_emit = now
+        if self.is_running:
+            self.count_updated.emit(count, True)
+
+
 class ImageAnalyzerApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.init_ui()
         self.apply_styles()
         self.analysis_thread = None
+        self.count_thread = None
         self.async_tasks = []
 
     def init_ui(self):
@@ -277,10 +150,41 @@ class ImageAnalyzerApp(QMainWindow):
         self.stop_btn.clicked.connect(self.stop_analysis)
         self.stop_btn.setEnabled(False)
 
+        self.export_btn = QPushButton("💾 Экспарт...")
+        self.export_btn.setMinimumHeight(80)
+        self.export_btn.setFont(QFont("Segoe UI", 28))
+        self.export_btn.setToolTip("Файл (CSV, JSON Lines або Parquet), у які вынікі "
+                                   "запісваюцца падчас наступнага аналізу")
+        self.export_btn.clicked.connect(self.choose_export_file)
+        self.export_path = None
+
         self.advanced_cb = QCheckBox("Паказваць інфармацыю пра колерную сістэму")
         self.advanced_cb.setFont(QFont("Segoe UI", 28))
         self.advanced_cb.setStyleSheet("QCheckBox { spacing: 20px; }")
 
+        concurrency_label = QLabel("Паралельна:")
+        concurrency_label.setFont(QFont("Segoe UI", 28))
+        self.concurrency_spin = QSpinBox()
+        self.concurrency_spin.setRange(1, 64)
+        self.concurrency_spin.setValue(default_concurrency('thread'))
+        self.concurrency_spin.setMinimumHeight(80)
+        self.concurrency_spin.setFont(QFont("Segoe UI", 28))
+        self.concurrency_spin.setToolTip("Колькасць файлаў, якія аналізуюцца адначасова")
+
+        self.backend_combo = QComboBox()
+        self.backend_combo.addItem("Патокі", 'thread')
+        self.backend_combo.addItem("Працэсы", 'process')
+        self.backend_combo.setMinimumHeight(80)
+        self.backend_combo.setFont(QFont("Segoe UI", 28))
+        self.backend_combo.setToolTip("Працэсы не абмежаваныя GIL і хутчэйшыя пры дэкадаванні і разборы ICC профіляў")
+        self.backend_combo.currentIndexChanged.connect(self.backend_changed)
+
+        self.cache_cb = QCheckBox("Кэш")
+        self.cache_cb.setFont(QFont("Segoe UI", 28))
+        self.cache_cb.setChecked(True)
+        self.cache_cb.setToolTip("Не перачытваць файлы, памер і час змены якіх не змяніліся "
+                                 f"з мінулага аналізу ({DEFAULT_CACHE_PATH})")
+
         folder_label = QLabel("Папка:")
         folder_label.setFont(QFont("Segoe UI", 28))
 
@@ -289,7 +193,12 @@ class ImageAnalyzerApp(QMainWindow):
         control_layout.addWidget(self.browse_btn)
         control_layout.addWidget(self.analyze_btn)
         control_layout.addWidget(self.stop_btn)
+        control_layout.addWidget(self.export_btn)
         control_layout.addWidget(self.advanced_cb)
+        control_layout.addWidget(concurrency_label)
+        control_layout.addWidget(self.concurrency_spin)
+        control_layout.addWidget(self.backend_combo)
+        control_layout.addWidget(self.cache_cb)
 
         layout.addWidget(control_group)
 
@@ -306,18 +215,21 @@ class ImageAnalyzerApp(QMainWindow):
         layout.addWidget(self.status_label)
 
 
-        self.results_table = QTableWidget()
-        self.results_table.setColumnCount(7)
-        self.results_table.setHorizontalHeaderLabels([
-            "Імя файла", "Памер (px)", "Разр. (DPI)",
-            "Глыбіня колеру", "Сцісканне", "Фармат", "Колерная сістэма"
-        ])
+        # Rows live in a columnar model; the view only asks for the text of
+        # the rows it paints, so rows get a fixed height instead of being
+        # measured.
+        self.results_model = ResultsTableModel(self)
+        self.results_table = QTableView()
+        self.results_table.setModel(self.results_model)
 
 
         self.results_table.setFont(QFont("Segoe UI", 24))
+        self.results_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.results_table.verticalHeader().setDefaultSectionSize(60)
         header = self.results_table.horizontalHeader()
         header.setFont(QFont("Segoe UI", 26, QFont.Bold))
         header.setDefaultSectionSize(300)
+        header.setResizeContentsPrecision(100)
         header.setSectionResizeMode(0, QHeaderView.ResizeToContents)
         header.setSectionResizeMode(1, QHeaderView.ResizeToContents)
         header.setSectionResizeMode(2, QHeaderView.ResizeToContents)
@@ -410,7 +322,7 @@ class ImageAnalyzerApp(QMainWindow):
                 padding: 0 15px 0 15px;
                 font-size: 32px;
             }
-            QTableWidget {
+            QTableView {
                 border: 3px solid #ddd;
                 border-radius: 18px;
                 background-color: white;
@@ -461,14 +373,33 @@ class ImageAnalyzerApp(QMainWindow):
         folder = QFileDialog.getExistingDirectory(self, "Выберыце папку з выявамі")
         if folder:
             self.folder_path_edit.setText(folder)
-            supported_formats = {'.jpg', '.jpeg', '.gif', '.tif', '.tiff', '.bmp', '.png', '.pcx'}
-            count = 0
-            for root, dirs, files in os.walk(folder):
-                for file in files:
-                    ext = os.path.splitext(file)[1].lower()
-                    if ext in supported_formats:
-                        count += 1
-            self.stats_label.setText(f"Знойдзена падтрымоўваемых файлаў: {count}")
+            self.stop_counting()
+            self.count_thread = FileCountThread(folder)
+            self.count_thread.count_updated.connect(self.update_file_count)
+            self.count_thread.start()
+
+    def choose_export_file(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Экспарт вынікаў", "",
+            "CSV (*.csv);;JSON Lines (*.jsonl);;Parquet (*.parquet)")
+        self.export_path = path or None
+        if self.export_path:
+            self.statusBar().showMessage(f"Вынікі будуць экспартаваныя ў {self.export_path}")
+        else:
+            self.statusBar().showMessage("Экспарт адключаны")
+
+    def backend_changed(self):
+        self.concurrency_spin.setValue(default_concurrency(self.backend_combo.currentData()))
+
+    def stop_counting(self):
+        if self.count_thread and self.count_thread.isRunning():
+            self.count_thread.count_updated.disconnect()
+            self.count_thread.stop()
+            self.count_thread.wait()
+
+    def update_file_count(self, count, done):
+        suffix = "" if done else "..."
+        self.stats_label.setText(f"Знойдзена падтрымоўваемых файлаў: {count}{suffix}")
 
     def start_analysis(self):
         folder_path = self.folder_path_edit.text()
@@ -478,20 +409,32 @@ class ImageAnalyzerApp(QMainWindow):
             return
 
 
-        self.results_table.setRowCount(0)
+        self.stop_counting()
+        self.results_model.clear()
+        # Rows are appended as results arrive; sorting stays off until the
+        # analysis ends so new rows are not re-sorted on every insert.
+        self.results_table.setSortingEnabled(False)
 
 
         self.analyze_btn.setEnabled(False)
         self.stop_btn.setEnabled(True)
         self.progress_bar.setVisible(True)
+        self.progress_bar.setRange(0, 0)
         self.progress_bar.setValue(0)
 
 
         self.analysis_thread = ImageAnalysisThread(
             folder_path,
-            self.advanced_cb.isChecked()
+            self.advanced_cb.isChecked(),
+            self.concurrency_spin.value(),
+            DEFAULT_CACHE_PATH if self.cache_cb.isChecked() else None,
+            self.backend_combo.currentData(),
+            self.export_path
         )
         self.analysis_thread.progress_updated.connect(self.update_progress)
+        self.analysis_thread.files_found.connect(self.update_file_count)
+        self.analysis_thread.results_batch.connect(self.add_results)
+        self.analysis_thread.cache_stats.connect(self.show_cache_stats)
         self.analysis_thread.analysis_finished.connect(self.analysis_finished)
         self.analysis_thread.error_occurred.connect(self.handle_error)
         self.analysis_thread.start()
@@ -503,37 +446,40 @@ class ImageAnalyzerApp(QMainWindow):
 
         self.analyze_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
+        self.progress_bar.setRange(0, 100)
+        self.results_table.setSortingEnabled(True)
         self.status_label.setText("Аналіз спынены")
 
     def update_progress(self, progress, current, filename):
+        # The bar stays in busy mode until the walker has found every file.
+        if self.progress_bar.maximum() == 0 and progress > 0:
+            self.progress_bar.setRange(0, 100)
         self.progress_bar.setValue(progress)
         self.status_label.setText(f"Апрацоўка: {filename} ({current} файлаў)")
 
+    def show_cache_stats(self, hits, misses):
+        self.statusBar().showMessage(f"Кэш: трапленняў {hits}, промахаў {misses}")
+
     def handle_error(self, error_message):
         QMessageBox.warning(self, "Памылка", error_message)
         self.stop_analysis()
 
-    def analysis_finished(self, results):
-
-        self.results_table.setRowCount(len(results))
-
-        for row, result in enumerate(results):
-            self.results_table.setItem(row, 0, QTableWidgetItem(result['filename']))
-            self.results_table.setItem(row, 1, QTableWidgetItem(result['size']))
-            self.results_table.setItem(row, 2, QTableWidgetItem(result['dpi']))
-            self.results_table.setItem(row, 3, QTableWidgetItem(result['color_depth']))
-            self.results_table.setItem(row, 4, QTableWidgetItem(result['compression']))
-            self.results_table.setItem(row, 5, QTableWidgetItem(result['format']))
-            self.results_table.setItem(row, 6, QTableWidgetItem(result['advanced']))
+    def add_results(self, results):
+        # Sorting is off while the analysis runs (see start_analysis), so a
+        # batch is simply appended to the model.
+        self.results_model.append_results(results)
 
+    def analysis_finished(self, count):
+        # Every row has already been added by add_results.
+        self.results_table.setSortingEnabled(True)
 
         self.analyze_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
         self.progress_bar.setVisible(False)
-        self.status_label.setText(f"Аналіз завершаны. Апрацавана файлаў: {len(results)}")
+        self.status_label.setText(f"Аналіз завершаны. Апрацавана файлаў: {count}")
 
         QMessageBox.information(self, "Завершана",
-                                f"Аналіз паспяхова завершаны!\nАпрацавана файлаў: {len(results)}")
+                                f"Аналіз паспяхова завершаны!\nАпрацавана файлаў: {count}")
 
 
 def main():
@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".image_analyzer_cache.sqlite3")
+
+# Rows beyond this many are dropped, least recently seen first.
+MAX_ROWS = 1000000
+# Bumped whenever the stored result dicts change shape; older rows are dropped.
+CACHE_VERSION = 3
+# Pending writes are committed in one transaction once this many are queued.
+FLUSH_SIZE = 1000
+
+
+# One row per (path, show_advanced). A row is valid while the file's size
+# and mtime_ns still match; last_seen is the time of the last scan that met
+# the file and drives pruning.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    path TEXT NOT NULL,
+    show_advanced INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    last_seen REAL NOT NULL,
+    PRIMARY KEY (path, show_advanced)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_last_seen ON results (last_seen);
+"""
+
+
+def path_range(folder_path):
+    # Bounds of the paths under folder_path as a range that the primary key
+    # index answers: every such path starts with the folder and a separator,
+    # and sorts before the same prefix with the separator incremented.
+    prefix = os.path.join(os.path.abspath(folder_path), "")
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class MetadataCache:
+    def __init__(self, db_path=DEFAULT_CACHE_PATH):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != CACHE_VERSION:
+            with self.conn:
+                self.conn.execute("DROP TABLE IF EXISTS results")
+                self.conn.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+        self.conn.executescript(SCHEMA)
+        # The walker thread looks files up while the event loop stores new
+        # results, so the pending lists and the connection share a lock.
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.pending_results = []
+        self.pending_seen = []
+        self.scan_started = time.time()
+        self.hits = 0
+        self.misses = 0
+
+    def begin_scan(self, show_advanced, folder_path):
+        # Loads the rows for this mode under folder_path into memory once, so
+        # lookups during the scan are dictionary hits instead of queries.
+        # Rows of other folders stay on disk.
+        self.scan_started = time.time()
+        self.show_advanced = int(bool(show_advanced))
+        self.hits = 0
+        self.misses = 0
+        rows = self.conn.execute(
+            "SELECT path, size, mtime_ns, result FROM results "
+            "WHERE path >= ? AND path < ? AND show_advanced = ?",
+            path_range(folder_path) + (self.show_advanced,))
+        self.entries = {path: (size, mtime_ns, result) for path, size, mtime_ns, result in rows}
+
+    def lookup(self, path, size, mtime_ns):
+        # Cached result dict for an unchanged file, else None. Either way the
+        # path is marked as seen in this scan.
+        entry = self.entries.get(path)
+        with self.lock:
+            self.pending_seen.append((self.scan_started, path))
+            if entry is not None and entry[0] == size and entry[1] == mtime_ns:
+                self.hits += 1
+                result = json.loads(entry[2])
+            else:
+                self.misses += 1
+                result = None
+            if len(self.pending_seen) >= FLUSH_SIZE:
+                self._flush()
+        return result
+
+    def store(self, path, size, mtime_ns, result):
+        row = (path, self.show_advanced, size, mtime_ns,
+               json.dumps(result, ensure_ascii=False), self.scan_started)
+        with self.lock:
+            self.pending_results.append(row)
+            if len(self.pending_results) >= FLUSH_SIZE:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending_results and not self.pending_seen:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE results SET last_seen = ? WHERE path = ?", self.pending_seen)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                self.pending_results)
+        self.pending_results = []
+        self.pending_seen = []
+
+    def prune(self, folder_path):
+        # Only call after a scan of folder_path ran to completion: rows under
+        # it that the scan did not meet belong to deleted files. The table is
+        # then trimmed to MAX_ROWS by dropping the least recently seen rows.
+        with self.lock, self.conn:
+            self._flush()
+            self.conn.execute(
+                "DELETE FROM results WHERE path >= ? AND path < ? AND last_seen < ?",
+                path_range(folder_path) + (self.scan_started,))
+            self.conn.execute(
+                "DELETE FROM results WHERE last_seen < (SELECT last_seen FROM results "
+                "ORDER BY last_seen DESC LIMIT 1 OFFSET ?)", (MAX_ROWS - 1,))
+
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,142 @@
+from array import array
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+
+HEADERS = ["Імя файла", "Памер (px)", "Разр. (DPI)",
+           "Глыбіня колеру", "Сцісканне", "Фармат", "Колерная сістэма"]
+
+NAME, SIZE, DPI, COLOR_DEPTH, COMPRESSION, FORMAT, ADVANCED = range(7)
+POOLED = {COLOR_DEPTH: 'color_depth', COMPRESSION: 'compression',
+          FORMAT: 'format', ADVANCED: 'advanced'}
+
+ERROR_TEXT = "Памылка"
+
+
+class StringPool:
+    # Each distinct string is stored once; rows keep only its index.
+    def __init__(self):
+        self.strings = []
+        self.ids = {}
+
+    def add(self, s):
+        string_id = self.ids.get(s)
+        if string_id is None:
+            string_id = self.ids[s] = len(self.strings)
+            self.strings.append(s)
+        return string_id
+
+
+class ResultsTableModel(QAbstractTableModel):
+    # Results are stored by column instead of as one dict per row:
+    #   file names  - UTF-8 bytes in one bytearray plus an offset array
+    #   width/height - int arrays, -1 for files that failed to open
+    #   dpi_x/dpi_y  - double arrays, 0 when the file has no resolution;
+    #                  the DPI text is pooled as the analyzer wrote it, so
+    #                  it reads exactly like the value in the file
+    #   text columns - indices into a StringPool per column
+    # `order` maps view rows to stored rows, so sorting only permutes it.
+    # Cell text is produced in data(), i.e. only for rows the view paints.
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.clear()
+
+    def clear(self):
+        self.beginResetModel()
+        self.names = bytearray()
+        self.name_offsets = array('Q', [0])
+        self.width = array('i')
+        self.height = array('i')
+        self.dpi_x = array('d')
+        self.dpi_y = array('d')
+        self.dpi_pool = StringPool()
+        self.dpi_ids = array('I')
+        self.pools = {column: StringPool() for column in POOLED}
+        self.ids = {column: array('I') for column in POOLED}
+        self.order = array('I')
+        self.endResetModel()
+
+    def append_results(self, results):
+        if not results:
+            return
+        first = len(self.order)
+        self.beginInsertRows(QModelIndex(), first, first + len(results) - 1)
+        for result in results:
+            self.names += result['filename'].encode('utf-8', 'surrogateescape')
+            self.name_offsets.append(len(self.names))
+            self.width.append(result.get('width', -1))
+            self.height.append(result.get('height', -1))
+            self.dpi_x.append(result.get('dpi_x', 0.0))
+            self.dpi_y.append(result.get('dpi_y', 0.0))
+            self.dpi_ids.append(self.dpi_pool.add(result.get('dpi', "-")))
+            for column, key in POOLED.items():
+                self.ids[column].append(self.pools[column].add(result[key]))
+            self.order.append(len(self.order))
+        self.endInsertRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.order)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        return self.text(self.order[index.row()], index.column())
+
+    def name(self, row):
+        start, end = self.name_offsets[row], self.name_offsets[row + 1]
+        return self.names[start:end].decode('utf-8', 'surrogateescape')
+
+    def text(self, row, column):
+        if column == NAME:
+            return self.name(row)
+        if column in POOLED:
+            return self.pools[column].strings[self.ids[column][row]]
+        if self.width[row] < 0:
+            return ERROR_TEXT
+        if column == SIZE:
+            return f"{self.width[row]} × {self.height[row]}"
+        return self.dpi_pool.strings[self.dpi_ids[row]]
+
+    def sort_key(self, column):
+        # Size sorts by pixel count and DPI by its horizontal value, both as
+        # numbers; text columns sort by each pooled string's rank, so every
+        # distinct string is compared only once.
+        if column == NAME:
+            names, offsets = self.names, self.name_offsets
+            return lambda row: names[offsets[row]:offsets[row + 1]]
+        if column == SIZE:
+            width, height = self.width, self.height
+            return lambda row: (width[row] * height[row], width[row])
+        if column == DPI:
+            dpi_x, dpi_y = self.dpi_x, self.dpi_y
+            return lambda row: (dpi_x[row], dpi_y[row])
+        strings = self.pools[column].strings
+        rank = [0] * len(strings)
+        for position, string_id in enumerate(sorted(range(len(strings)), key=strings.__getitem__)):
+            rank[string_id] = position
+        ids = self.ids[column]
+        return lambda row: rank[ids[row]]
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        stored = [self.order[index.row()] for index in persistent]
+        rows = sorted(range(len(self.order)), key=self.sort_key(column),
+                      reverse=order == Qt.DescendingOrder)
+        self.order = array('I', rows)
+        if persistent:
+            position = array('I', bytes(4 * len(rows)))
+            for view_row, row in enumerate(rows):
+                position[row] = view_row
+            self.changePersistentIndexList(
+                persistent,
+                [self.index(position[row], index.column()) for row, index in zip(stored, persistent)])
+        self.layoutChanged.emit()
@@ -0,0 +1,269 @@
+import numpy as np
+
+
+# The per-pixel loop implementations from the first version of main.py and
+# noise.py, kept unchanged (except that gaussian_blur returns the array, not
+# a PIL image) as references for `benchmark.py --check`. They are slow, so
+# the check runs them on a small image only.
+
+
+def rgb_to_hsv(rgb):
+    rgb = rgb.astype(np.float32) / 255.0
+    r, g, b = rgb[:, :, 0], rgb[:, :, 1], rgb[:, :, 2]
+    mx = np.max(rgb, axis=2)
+    mn = np.min(rgb, axis=2)
+    df = mx - mn
+
+    h = np.zeros_like(mx)
+    mask = df != 0
+    h[mask & (mx == r)] = (60 * ((g - b) / df) % 6)[mask & (mx == r)]
+    h[mask & (mx == g)] = (60 * ((b - r) / df) + 120)[mask & (mx == g)]
+    h[mask & (mx == b)] = (60 * ((r - g) / df) + 240)[mask & (mx == b)]
+    h = np.clip(h, 0, 360)
+
+    s = np.zeros_like(mx)
+    s[mask] = df[mask] / mx[mask]
+    s = np.clip(s, 0, 1)
+
+    v = mx
+    hsv = np.stack([h, s * 255, v * 255], axis=2)
+    return hsv.astype(np.uint8)
+
+
+def hsv_to_rgb(hsv):
+    h, s, v = hsv[:, :, 0].astype(np.float32), hsv[:, :, 1].astype(np.float32) / 255.0, hsv[:, :, 2].astype(np.float32) / 255.0
+    c = v * s
+    x = c * (1 - np.abs((h / 60) % 2 - 1))
+    m = v - c
+
+    rgb = np.zeros((h.shape[0], h.shape[1], 3), dtype=np.float32)
+    mask = (h >= 0) & (h < 60)
+    rgb[mask] = np.stack([c[mask], x[mask], np.zeros_like(c[mask])], axis=1)
+    mask = (h >= 60) & (h < 120)
+    rgb[mask] = np.stack([x[mask], c[mask], np.zeros_like(c[mask])], axis=1)
+    mask = (h >= 120) & (h < 180)
+    rgb[mask] = np.stack([np.zeros_like(c[mask]), c[mask], x[mask]], axis=1)
+    mask = (h >= 180) & (h < 240)
+    rgb[mask] = np.stack([np.zeros_like(c[mask]), x[mask], c[mask]], axis=1)
+    mask = (h >= 240) & (h < 300)
+    rgb[mask] = np.stack([x[mask], np.zeros_like(c[mask]), c[mask]], axis=1)
+    mask = (h >= 300) & (h <= 360)
+    rgb[mask] = np.stack([c[mask], np.zeros_like(c[mask]), x[mask]], axis=1)
+
+    rgb = (rgb + m[:, :, np.newaxis]) * 255
+    return np.clip(rgb, 0, 255).astype(np.uint8)
+
+
+def linear_contrast(img):
+    if img.ndim == 3:
+        out = np.zeros_like(img)
+        for c in range(3):
+            channel = img[:, :, c].astype(np.float32)
+            min_val, max_val = channel.min(), channel.max()
+            if max_val == min_val:
+                out[:, :, c] = channel
+            else:
+                out[:, :, c] = 255 * (channel - min_val) / (max_val - min_val)
+        return np.clip(out, 0, 255).astype(np.uint8)
+    else:
+        img = img.astype(np.float32)
+        min_val, max_val = img.min(), img.max()
+        if max_val == min_val:
+            return img.astype(np.uint8)
+        stretched = 255 * (img - min_val) / (max_val - min_val)
+        return np.clip(stretched, 0, 255).astype(np.uint8)
+
+
+def hist_equalize_grayscale(gray):
+    hist, _ = np.histogram(gray.flatten(), bins=256, range=(0, 256))
+    cdf = hist.cumsum()
+    cdf_normalized = (cdf - cdf.min()) * 255 / (cdf.max() - cdf.min())
+    cdf_normalized = np.ma.filled(np.ma.masked_less(cdf_normalized, 0), 0).astype(np.uint8)
+    return cdf_normalized[gray]
+
+
+def hist_equalize_rgb(img):
+    out = np.zeros_like(img)
+    for c in range(3):
+        out[:, :, c] = hist_equalize_grayscale(img[:, :, c])
+    return out
+
+
+def hist_equalize_hsv(img):
+    hsv = rgb_to_hsv(img)
+    h, s, v = hsv[:, :, 0], hsv[:, :, 1], hsv[:, :, 2]
+    v_eq = hist_equalize_grayscale(v)
+    hsv_eq = np.stack([h, s, v_eq], axis=2)
+    return hsv_to_rgb(hsv_eq)
+
+
+def grayscale(img):
+    if img.ndim == 3:
+        return (0.2989 * img[:, :, 0] + 0.5870 * img[:, :, 1] + 0.1140 * img[:, :, 2]).astype(np.uint8)
+    return img
+
+
+def sobel_edge(gray):
+    Kx = np.array([[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]])
+    Ky = np.array([[1, 2, 1], [0, 0, 0], [-1, -2, -1]])
+
+    h, w = gray.shape
+    pad = 1
+    padded = np.pad(gray, pad, mode='constant')
+    Gx = np.zeros_like(gray, dtype=np.float32)
+    Gy = np.zeros_like(gray, dtype=np.float32)
+
+    
+    for i in range(1, h+1):
+        for j in range(1, w+1):
+            region = padded[i-1:i+2, j-1:j+2]
+            Gx[i-1, j-1] = np.sum(Kx * region)
+            Gy[i-1, j-1] = np.sum(Ky * region)
+
+    mag = np.hypot(Gx, Gy)
+    if mag.max() == 0:
+        return np.zeros_like(mag, dtype=np.uint8)
+    mag = mag / mag.max() * 255
+    return mag.astype(np.uint8)
+
+
+def detect_edges(img, low=50, high=150, use_hysteresis=True):
+    gray = grayscale(img)
+    edges = sobel_edge(gray)
+    
+    
+    final = np.zeros_like(edges)
+    
+    
+    strong = edges >= high
+    final[strong] = 255
+    
+    if use_hysteresis and low < high:
+        
+        weak = (edges >= low) & (edges < high)
+        
+        h, w = edges.shape
+        for i in range(1, h-1):
+            for j in range(1, w-1):
+                if weak[i, j] and np.any(strong[i-1:i+2, j-1:j+2]):
+                    final[i, j] = 255
+    else:
+        final[edges >= low] = 255
+        
+    return final
+
+
+
+def hough_line_transform(edges, angle_step=1, threshold=100, min_line_length=50, max_line_gap=10):
+    h, w = edges.shape
+    diag = int(np.ceil(np.sqrt(h**2 + w**2)))
+    thetas = np.deg2rad(np.arange(-90, 90, angle_step))
+    rhos = np.linspace(-diag, diag, diag*2)
+
+    cos_t = np.cos(thetas)
+    sin_t = np.sin(thetas)
+    num_thetas = len(thetas)
+
+    accumulator = np.zeros((len(rhos), num_thetas), dtype=np.int32)
+
+    y_idxs, x_idxs = np.nonzero(edges)
+    for i in range(len(x_idxs)):
+        x = x_idxs[i]
+        y = y_idxs[i]
+        for t_idx in range(num_thetas):
+            rho = x * cos_t[t_idx] + y * sin_t[t_idx]
+            rho_idx = int(round(rho)) + diag
+            if 0 <= rho_idx < len(rhos):
+                accumulator[rho_idx, t_idx] += 1
+
+    lines = []
+    for rho_idx in range(accumulator.shape[0]):
+        for theta_idx in range(accumulator.shape[1]):
+            if accumulator[rho_idx, theta_idx] >= threshold:
+                rho = rhos[rho_idx]
+                theta = thetas[theta_idx]
+                lines.append((rho, theta))
+                
+    return lines
+
+
+def harris_corner(img, k=0.04, threshold=0.01, min_distance=10):
+    gray = grayscale(img).astype(np.float32)
+    Ix = np.zeros_like(gray)
+    Iy = np.zeros_like(gray)
+    Ix[1:-1, :] = gray[2:, :] - gray[:-2, :]
+    Iy[:, 1:-1] = gray[:, 2:] - gray[:, :-2]
+
+    Ixx = Ix ** 2
+    Iyy = Iy ** 2
+    Ixy = Ix * Iy
+
+    def gaussian_kernel(size=5, sigma=1.0):
+        ax = np.arange(-size // 2 + 1., size // 2 + 1.)
+        xx, yy = np.meshgrid(ax, ax)
+        kernel = np.exp(-(xx**2 + yy**2) / (2 * sigma**2))
+        return kernel / np.sum(kernel)
+
+    kernel = gaussian_kernel()
+    Sxx = convolve2d(Ixx, kernel)
+    Syy = convolve2d(Iyy, kernel)
+    Sxy = convolve2d(Ixy, kernel)
+
+    det = Sxx * Syy - Sxy ** 2
+    trace = Sxx + Syy
+    R = det - k * (trace ** 2)
+
+    
+    corners = R > (threshold * R.max())
+    
+    
+    if min_distance > 0:
+        from scipy.ndimage import maximum_filter
+        data_max = maximum_filter(R, size=min_distance)
+        corners = (R == data_max) & corners
+        
+    return corners.astype(np.uint8)
+
+
+def convolve2d(image, kernel):
+    h, w = image.shape
+    kh, kw = kernel.shape
+    pad_h, pad_w = kh // 2, kw // 2
+    padded = np.pad(image, ((pad_h, pad_h), (pad_w, pad_w)), mode='constant')
+    output = np.zeros_like(image)
+    for i in range(h):
+        for j in range(w):
+            output[i, j] = np.sum(padded[i:i+kh, j:j+kw] * kernel)
+    return output
+
+
+
+def gaussian_blur(img, kernel_size=15, sigma=3.0):
+    
+    def gaussian_kernel(size, sigma):
+        ax = np.arange(-size // 2 + 1., size // 2 + 1.)
+        xx, yy = np.meshgrid(ax, ax)
+        kernel = np.exp(-(xx**2 + yy**2) / (2 * sigma**2))
+        return kernel / np.sum(kernel)
+    
+    img_array = np.array(img)
+    kernel = gaussian_kernel(kernel_size, sigma)
+    pad = kernel_size // 2
+    if img_array.ndim == 3:
+        blurred = np.zeros_like(img_array)
+        for c in range(3):
+            padded = np.pad(img_array[:, :, c], pad, mode='edge')
+            for i in range(img_array.shape[0]):
+                for j in range(img_array.shape[1]):
+                    blurred[i, j, c] = np.sum(
+                        padded[i:i+kernel_size, j:j+kernel_size] * kernel
+                    )
+    else:
+        padded = np.pad(img_array, pad, mode='edge')
+        blurred = np.zeros_like(img_array)
+        for i in range(img_array.shape[0]):
+            for j in range(img_array.shape[1]):
+                blurred[i, j] = np.sum(
+                    padded[i:i+kernel_size, j:j+kernel_size] * kernel
+                )
+    return np.clip(blurred, 0, 255).astype(np.uint8)
@@ -0,0 +1,568 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import platform
+import tracemalloc
+from pathlib import Path
+import numpy as np
+from PIL import Image
+
+import main
+import noise
+import baseline
+import tiling
+from convolution import convolve2d
+
+
+SIZES = {
+    "vga": (480, 640),
+    "1080p": (1080, 1920),
+    "4k": (2160, 3840),
+    "24mp": (4000, 6000),
+}
+INPUTS = ["synthetic", "photo"]
+RESULTS_VERSION = 1
+
+
+# Every kernel gets a `prepare` step that builds its arguments from the RGB
+# input outside of the timed region (e.g. the edge map for Hough), and the
+# kernel call itself, which is what gets timed.
+
+def _rgb(img):
+    return (img,), {}
+
+
+def _gray(img):
+    return (main.grayscale(img),), {}
+
+
+def _edges(img):
+    return (main.detect_edges(img),), {}
+
+
+def _degradation(suffix):
+    for name, func, params in noise.DEGRADATIONS:
+        if name == suffix:
+            return func, params
+    raise KeyError(suffix)
+
+
+def _noise_kernel(suffix):
+    func, params = _degradation(suffix)
+    # The degradations return PIL images; the array is what gets compared.
+    return lambda img: np.asarray(func(img, **params))
+
+
+def _gaussian_noise(img):
+    # add_gaussian_noise draws from the global RNG; seed it so two runs
+    # produce the same output and can be compared.
+    np.random.seed(0)
+    return _noise_kernel("noisy")(img)
+
+
+KERNELS = {
+    "linear_contrast": (_rgb, main.linear_contrast),
+    "hist_equalize_grayscale": (_gray, main.hist_equalize_grayscale),
+    "hist_equalize_rgb": (_rgb, main.hist_equalize_rgb),
+    "hist_equalize_hsv": (_rgb, main.hist_equalize_hsv),
+    "sobel_edge": (_gray, main.sobel_edge),
+    "detect_edges": (_rgb, main.detect_edges),
+    "canny_edges": (_rgb, main.canny_edges),
+    "hough_line_transform": (_edges, main.hough_line_transform),
+    "harris_corner": (_rgb, main.harris_corner),
+    "noise_gaussian": (_rgb, _gaussian_noise),
+    "noise_blur": (_rgb, _noise_kernel("blurred")),
+    "noise_low_contrast": (_rgb, _noise_kernel("low_contrast")),
+    "noise_dark": (_rgb, _noise_kernel("dark")),
+    "noise_overexposed": (_rgb, _noise_kernel("overexposed")),
+}
+
+
+# Alternative implementations that must give the same result as a kernel
+# above: kernel name -> list of (variant name, function, tolerance). The
+# tolerance is the largest allowed absolute difference (0 - exact match).
+# Faster versions of a kernel are added here so --check can prove them
+# against the reference before they replace it.
+
+def _blur_2d(img):
+    # The same Gaussian as noise.gaussian_blur as one 2-D kernel.
+    params = _degradation("blurred")[1]
+    size, sigma = params["kernel_size"], params["sigma"]
+    ax = np.arange(-size // 2 + 1., size // 2 + 1.)
+    k1 = np.exp(-ax**2 / (2 * sigma**2))
+    k1 /= k1.sum()
+    out = convolve2d(img.astype(np.float32), np.outer(k1, k1), mode='edge', method='fft')
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+
+def _sobel_fft(gray):
+    Kx = np.array([[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]])
+    Ky = np.array([[1, 2, 1], [0, 0, 0], [-1, -2, -1]])
+    Gx = convolve2d(gray, Kx, method='fft')
+    Gy = convolve2d(gray, Ky, method='fft')
+    return main.normalize_magnitude(np.hypot(Gx, Gy))
+
+
+def _banded(stage):
+    # A tiling.py stage over row bands, one band per core.
+    def run(img, *args):
+        workers = tiling.DEFAULT_WORKERS
+        rows = tiling.band_rows(img.shape, None, workers)
+        with tiling.BandScheduler(len(img), rows, workers, keep=True) as bands:
+            return stage(img, bands, *args)
+    return run
+
+
+def _linear_contrast_banded(img, bands):
+    out = np.empty_like(img)
+    tiling.linear_contrast_tiled(img, out, bands)
+    return out
+
+
+def _harris_banded(img, bands):
+    points = np.zeros(img.shape[:2], dtype=np.uint8)
+    points[tiling.harris_corner_tiled(img, bands)] = 1
+    return points
+
+
+def _hough_banded(edges, bands):
+    thetas, rhos, accumulator = tiling.hough_accumulator_tiled(edges, bands)
+    return main.hough_peaks(accumulator, rhos, thetas)
+
+
+BANDED = f"палосы, {tiling.DEFAULT_WORKERS} пат."
+
+VARIANTS = {
+    "noise_blur": [("convolve2d fft, 2-D ядро", _blur_2d, 1)],
+    "sobel_edge": [("convolve2d fft", _sobel_fft, 1)],
+    "linear_contrast": [(BANDED, _banded(_linear_contrast_banded), 0)],
+    "detect_edges": [(BANDED, _banded(tiling.detect_edges_tiled), 0)],
+    "canny_edges": [(BANDED, _banded(tiling.canny_edges_tiled), 0)],
+    "hough_line_transform": [(BANDED, _banded(_hough_banded), 0)],
+    "harris_corner": [(BANDED, _banded(_harris_banded), 0)],
+}
+
+
+# Behaviour checks run by --check alongside the variants: each returns
+# None when the output is as expected, or a short description of the
+# difference.
+
+def _check_inverted_thresholds():
+    # low > high: pixels >= high are strong edges whatever low is.
+    img = synthetic_image(SIZES["vga"])
+    expected = np.where(main.edge_magnitude(img) >= 100, 255, 0)
+    for use_hysteresis in (True, False):
+        for label, func in (("detect_edges", main.detect_edges),
+                            (BANDED, _banded(tiling.detect_edges_tiled))):
+            edges = func(img, 200, 100, use_hysteresis)
+            if not np.array_equal(edges, expected):
+                return (f"{label}, гістэрызіс {use_hysteresis}: {np.count_nonzero(edges)} "
+                        f"краёў замест {np.count_nonzero(expected)}")
+    return None
+
+
+def _check_shallow_line():
+    # A long line of slope 1/3 in 2% noise: the probabilistic transform has
+    # to find it end to end, although its angle is between two Hough cells.
+    # Noise pixels within max_line_gap of an end may extend the segment.
+    h, w = SIZES["1080p"]
+    edges = np.where(np.random.default_rng(0).random((h, w)) < 0.02, 255, 0).astype(np.uint8)
+    ends = np.array([[100, 200], [1800, 200 + 1700 // 3]])
+    ys, xs = main._segment_pixels(*ends[0], *ends[1])
+    edges[ys, xs] = 255
+    max_line_gap = 10
+    segments = main.probabilistic_hough_line(edges, max_line_gap=max_line_gap, seed=0)
+    for segment in segments:
+        segment = np.array(segment)
+        if segment[0, 0] > segment[1, 0]:
+            segment = segment[::-1]
+        # Covers the whole line and ends near its ends.
+        if (segment[0, 0] <= ends[0, 0] and segment[1, 0] >= ends[1, 0]
+                and np.abs(segment - ends).max() <= 2 * max_line_gap):
+            return None
+    longest = max(segments, key=lambda s: np.hypot(s[1][0] - s[0][0], s[1][1] - s[0][1]), default=None)
+    return f"лінія {ends.tolist()} не знойдзена, найдаўжэйшы адрэзак {longest}"
+
+
+def _check_canny_frame():
+    # The image border is not an edge (zero padding made it one).
+    img = synthetic_image(SIZES["vga"])
+    for label, func in (("canny_edges", main.canny_edges),
+                        (BANDED, _banded(tiling.canny_edges_tiled))):
+        edges = func(img)
+        frame = np.count_nonzero(edges[[0, -1]]) + np.count_nonzero(edges[:, [0, -1]])
+        if frame:
+            return f"{label}: {frame} краёў на рамцы выявы"
+    return None
+
+
+def _check_hough_seam():
+    # A line a little off horizontal votes on both sides of the theta axis
+    # seam (-90 deg and 89 deg with rho negated) and is one line, not two.
+    h, w = 200, 300
+    for dy in (-2, -1):
+        edges = np.zeros((h, w), dtype=np.uint8)
+        ys, xs = main._segment_pixels(20, h // 2, w - 20, h // 2 + dy)
+        edges[ys, xs] = 255
+        for label, func in (("hough_line_transform", main.hough_line_transform),
+                            (BANDED, _banded(_hough_banded))):
+            lines = func(edges)
+            if len(lines) != 1:
+                found = [(int(rho), int(round(np.rad2deg(theta)))) for rho, theta in lines]
+                return f"{label}, нахіл {dy}/{w - 40}: {len(lines)} ліній {found}"
+    return None
+
+
+REGRESSIONS = {
+    "парогі low > high": _check_inverted_thresholds,
+    "доўгая пакатая лінія (імавернасны Хаф)": _check_shallow_line,
+    "рамка выявы ў Кэні": _check_canny_frame,
+    "шво восі θ у Хафе": _check_hough_seam,
+}
+
+
+def run_regressions():
+    failures = []
+    print("\nПраверкі паводзін")
+    for name, check in REGRESSIONS.items():
+        problem = check()
+        print(f"    {'OK ' if problem is None else 'FAIL'} {name}"
+              f"{'' if problem is None else ': ' + problem}")
+        if problem is not None:
+            failures.append({"check": name, "problem": problem})
+    return failures
+
+
+# Comparison with the per-pixel loops of the first version (baseline.py) on
+# an input small enough for them: (kernel, label, check, tolerance), where
+# the check returns the difference between the current kernel and the loop.
+# Where a kernel changed its output on purpose, the check compares only the
+# part that was kept.
+
+BASELINE_SHAPE = (120, 160)
+
+
+def _baseline_exact(kernel, reference):
+    def check(img):
+        prepare, func = KERNELS[kernel]
+        args, kwargs = prepare(img)
+        return max_difference(func(*args, **kwargs), reference(*args, **kwargs))
+    return check
+
+
+def _baseline_blur(img):
+    # The separable float32 passes can land on the other side of an integer
+    # than the loop's float64 sum before the uint8 cast: tolerance 1.
+    return baseline.gaussian_blur(img, **_degradation("blurred")[1])
+
+
+def _baseline_thresholds(img):
+    return max_difference(main.detect_edges(img, 50, 150, False),
+                          baseline.detect_edges(img, 50, 150, False))
+
+
+def _baseline_hysteresis(img):
+    # The loop kept weak pixels next to a strong one, skipping the border.
+    # Connected components also keep weak chains that reach a strong pixel
+    # through other weak ones, and weak border pixels: every old edge has to
+    # stay, and every new one has to be at least weak.
+    edges = main.detect_edges(img) > 0
+    old = baseline.detect_edges(img) > 0
+    weak = main.edge_magnitude(img) >= 50
+    return np.count_nonzero(old & ~edges) + np.count_nonzero(edges & ~weak)
+
+
+def _baseline_hsv(img):
+    # The old HSV path wrapped hues above 255 in uint8 and took (60 * x) % 6
+    # for red hues, so only the equalized brightness V = max(R, G, B) is
+    # compared. It went through uint8 S and V, hence the tolerance of 1.
+    return max_difference(main.hist_equalize_hsv(img).max(axis=2),
+                          baseline.hist_equalize_hsv(img).max(axis=2))
+
+
+def _baseline_hough(img):
+    # With nms_size=1 every cell at or above the threshold is a line, as in
+    # the loop. Lines now come strongest first and rho is the integer bin
+    # centre rather than a linspace sample, so cells are compared by index.
+    # The threshold is lowered to suit the small input.
+    edges = main.detect_edges(img)
+    thetas, rhos = main.hough_axes(edges.shape)
+    old_rhos = np.linspace(rhos[0], -rhos[0], len(rhos))
+
+    def cells(lines, rho_axis):
+        return {(int(np.searchsorted(rho_axis, rho)), int(np.searchsorted(thetas, theta)))
+                for rho, theta in lines}
+
+    new = cells(main.hough_line_transform(edges, threshold=30, nms_size=1), rhos)
+    old = cells(baseline.hough_line_transform(edges, threshold=30), old_rhos)
+    return len(new ^ old) if old else np.inf
+
+
+BASELINE = [
+    ("linear_contrast", "linear_contrast", _baseline_exact("linear_contrast", baseline.linear_contrast), 0),
+    ("hist_equalize_grayscale", "hist_equalize_grayscale",
+     _baseline_exact("hist_equalize_grayscale", baseline.hist_equalize_grayscale), 0),
+    ("hist_equalize_rgb", "hist_equalize_rgb", _baseline_exact("hist_equalize_rgb", baseline.hist_equalize_rgb), 0),
+    ("hist_equalize_hsv", "hist_equalize_hsv, яркасць V", _baseline_hsv, 1),
+    ("sobel_edge", "sobel_edge", _baseline_exact("sobel_edge", baseline.sobel_edge), 0),
+    ("detect_edges", "detect_edges без гістэрызісу", _baseline_thresholds, 0),
+    ("detect_edges", "detect_edges, гістэрызіс (пікселі па-за старымі краямі і слабымі)",
+     _baseline_hysteresis, 0),
+    ("hough_line_transform", "hough_line_transform, nms_size=1 (несупадаючыя ячэйкі)", _baseline_hough, 0),
+    ("harris_corner", "harris_corner", _baseline_exact("harris_corner", baseline.harris_corner), 0),
+    ("noise_blur", "gaussian_blur", _baseline_exact("noise_blur", _baseline_blur), 1),
+]
+
+
+def run_baseline(kernels):
+    failures = []
+    img = synthetic_image(BASELINE_SHAPE)
+    print(f"\nПараўнанне з першай версіяй (baseline.py), {BASELINE_SHAPE[1]}x{BASELINE_SHAPE[0]}")
+    for kernel, label, check, tolerance in BASELINE:
+        if kernel not in kernels:
+            continue
+        start = time.perf_counter()
+        # The old HSV conversion divides by zero on grey pixels.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            diff = check(img)
+        elapsed = time.perf_counter() - start
+        ok = diff <= tolerance
+        print(f"    {'OK ' if ok else 'FAIL'} {label}: розніца {diff:g} "
+              f"(дапушчальна {tolerance}), {elapsed:.3f} с")
+        if not ok:
+            failures.append({"kernel": kernel, "variant": "baseline.py", "check": label,
+                             "difference": diff})
+    return failures
+
+
+def synthetic_image(shape, seed=0):
+    # Deterministic test card: smooth gradients, filled rectangles (straight
+    # edges and corners for Sobel/Hough/Harris) and mild noise.
+    h, w = shape
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0, 1, h, dtype=np.float32)[:, np.newaxis]
+    x = np.linspace(0, 1, w, dtype=np.float32)[np.newaxis, :]
+    img = np.empty((h, w, 3), dtype=np.float32)
+    img[:, :, 0] = 40 + 150 * x
+    img[:, :, 1] = 40 + 150 * y
+    img[:, :, 2] = 90 + 60 * np.sin(6 * x + 4 * y)
+    for _ in range(12):
+        y0, x0 = rng.integers(0, h * 3 // 4), rng.integers(0, w * 3 // 4)
+        y1 = y0 + rng.integers(h // 16, h // 4)
+        x1 = x0 + rng.integers(w // 16, w // 4)
+        img[y0:y1, x0:x1] = rng.integers(0, 256, 3)
+    img += rng.normal(0, 4, img.shape)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def photo_image(shape, path):
+    with Image.open(path) as img:
+        img = img.convert("RGB").resize((shape[1], shape[0]), Image.LANCZOS)
+        return np.asarray(img)
+
+
+def make_input(kind, shape, photo_path):
+    if kind == "synthetic":
+        return synthetic_image(shape)
+    return photo_image(shape, photo_path)
+
+
+def fingerprint(output):
+    # Stable hash of a kernel's output so runs on different revisions can be
+    # compared for identical results. Float arrays are rounded to 4 decimals
+    # and lists (Hough lines) are hashed through their rounded repr.
+    h = hashlib.sha256()
+    if isinstance(output, np.ndarray):
+        if output.dtype.kind == 'f':
+            output = np.round(output.astype(np.float64), 4)
+        h.update(str((output.shape, output.dtype.str)).encode())
+        h.update(np.ascontiguousarray(output).tobytes())
+    else:
+        h.update(repr([tuple(round(float(v), 4) for v in item) for item in output]).encode())
+    return h.hexdigest()[:16]
+
+
+def max_difference(a, b):
+    if isinstance(a, np.ndarray):
+        if a.shape != b.shape:
+            return np.inf
+        return float(np.abs(a.astype(np.float64) - b.astype(np.float64)).max(initial=0))
+    return 0.0 if fingerprint(a) == fingerprint(b) else np.inf
+
+
+def time_kernel(func, args, kwargs, repeat):
+    times = []
+    output = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = func(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return times, output
+
+
+def peak_memory(func, args, kwargs):
+    # Peak of memory traced during one extra call (numpy reports its buffers
+    # to tracemalloc); measured separately because tracing slows code down.
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmarks(kernels, sizes, inputs, photo_path, repeat=3, memory=True, check=False):
+    results = []
+    failures = []
+    for size in sizes:
+        shape = SIZES[size]
+        for kind in inputs:
+            img = make_input(kind, shape, photo_path)
+            megapixels = shape[0] * shape[1] / 1e6
+            for name in kernels:
+                prepare, func = KERNELS[name]
+                args, kwargs = prepare(img)
+                times, output = time_kernel(func, args, kwargs, repeat)
+                record = {
+                    "kernel": name, "size": size, "input": kind,
+                    "shape": list(shape), "megapixels": megapixels,
+                    "times": times, "best": min(times), "median": float(np.median(times)),
+                    "mp_per_s": megapixels / min(times),
+                    "peak_bytes": peak_memory(func, args, kwargs) if memory else None,
+                    "fingerprint": fingerprint(output),
+                }
+                results.append(record)
+                print_record(record)
+                if check:
+                    failures += check_variants(name, args, kwargs, output, size, kind)
+    return results, failures
+
+
+def check_variants(name, args, kwargs, reference, size, kind):
+    failures = []
+    for variant, func, tolerance in VARIANTS.get(name, []):
+        start = time.perf_counter()
+        output = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        diff = max_difference(reference, output)
+        ok = diff <= tolerance
+        print(f"    {'OK ' if ok else 'FAIL'} {variant}: розніца {diff:g} "
+              f"(дапушчальна {tolerance}), {elapsed:.3f} с")
+        if not ok:
+            failures.append({"kernel": name, "variant": variant, "size": size,
+                             "input": kind, "difference": diff})
+    return failures
+
+
+def print_record(r):
+    memory = f"{r['peak_bytes'] / 2**20:>9.1f}" if r["peak_bytes"] is not None else f"{'-':>9}"
+    print(f"{r['kernel']:<26} {r['size']:>6} {r['input']:>10} {r['best']:>9.4f} "
+          f"{r['median']:>9.4f} {r['mp_per_s']:>9.1f} {memory}  {r['fingerprint']}")
+
+
+def print_header():
+    print(f"{'Ядро':<26} {'Памер':>6} {'Уваход':>10} {'Лепшы, с':>9} "
+          f"{'Медыяна':>9} {'МП/с':>9} {'Пам., МБ':>9}  Адбітак")
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(results, baseline_path):
+    # Matches records by (kernel, size, input) and prints the speed-up of
+    # this run over the baseline, flagging outputs that changed.
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    old = {(r["kernel"], r["size"], r["input"]): r for r in baseline["results"]}
+    changed = 0
+    print(f"\nПараўнанне з {baseline_path}")
+    print(f"{'Ядро':<26} {'Памер':>6} {'Уваход':>10} {'Было, с':>9} {'Стала, с':>9} {'Паскор.':>8}")
+    for r in results:
+        prev = old.get((r["kernel"], r["size"], r["input"]))
+        if prev is None:
+            continue
+        same = prev["fingerprint"] == r["fingerprint"]
+        changed += not same
+        print(f"{r['kernel']:<26} {r['size']:>6} {r['input']:>10} {prev['best']:>9.4f} "
+              f"{r['best']:>9.4f} {prev['best'] / r['best']:>7.2f}x"
+              f"{'' if same else '  вынік змяніўся!'}")
+    return changed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Вымярэнне хуткасці алгарытмаў апрацоўкі выяў")
+    parser.add_argument("--kernels", default=",".join(KERNELS),
+                        help="спіс ядраў праз коску (па змаўчанні - усе)")
+    parser.add_argument("--sizes", default=",".join(SIZES),
+                        help=f"памеры праз коску: {', '.join(SIZES)}")
+    parser.add_argument("--inputs", default=",".join(INPUTS),
+                        help="synthetic - згенераваная выява, photo - выява з --image")
+    parser.add_argument("--image", default=None,
+                        help="фота для ўваходу photo (па змаўчанні - першае з input_images)")
+    parser.add_argument("--repeat", type=int, default=3, help="колькасць паўтораў кожнага замеру")
+    parser.add_argument("--no-memory", action="store_true", help="не вымяраць пікавую памяць")
+    parser.add_argument("--check", action="store_true",
+                        help="параўнаць альтэрнатыўныя рэалізацыі з эталоннымі, а ядры - з першай версіяй")
+    parser.add_argument("--output", default=None, help="JSON файл для вынікаў")
+    parser.add_argument("--compare", default=None, help="JSON файл папярэдняга запуску для параўнання")
+    return parser.parse_args()
+
+
+def split_list(value, known, what):
+    items = [item.strip() for item in value.split(",") if item.strip()]
+    unknown = [item for item in items if item not in known]
+    if unknown:
+        raise SystemExit(f"Невядомыя {what}: {', '.join(unknown)}")
+    return items
+
+
+def default_photo():
+    images = sorted(p for p in Path(noise.INPUT_DIR).glob("*")
+                    if p.suffix.lower() in (".jpg", ".jpeg", ".png", ".bmp"))
+    return str(images[0]) if images else None
+
+
+def main_cli():
+    args = parse_args()
+    kernels = split_list(args.kernels, KERNELS, "ядры")
+    sizes = split_list(args.sizes, SIZES, "памеры")
+    inputs = split_list(args.inputs, INPUTS, "ўваходы")
+    photo_path = args.image or default_photo()
+    if "photo" in inputs and photo_path is None:
+        print(f"Няма выяў у {noise.INPUT_DIR}, уваход photo прапушчаны")
+        inputs.remove("photo")
+
+    print_header()
+    results, failures = run_benchmarks(kernels, sizes, inputs, photo_path,
+                                       max(1, args.repeat), not args.no_memory, args.check)
+    if args.check:
+        failures += run_baseline(kernels)
+        failures += run_regressions()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"version": RESULTS_VERSION, "environment": environment(),
+                       "photo": photo_path, "results": results, "failures": failures},
+                      f, ensure_ascii=False, indent=1)
+        print(f"\nВынікі захаваны ў {args.output}")
+
+    changed = compare(results, args.compare) if args.compare else 0
+    if failures or changed:
+        print(f"\nНесупадзенняў з эталонам: {len(failures)}, змененых вынікаў: {changed}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
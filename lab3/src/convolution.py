@@ -0,0 +1,101 @@
+import numpy as np
+
+
+# Kernels with more taps than this go through the FFT path; smaller ones are
+# cheaper as a sum of shifted, scaled copies of the padded image.
+FFT_KERNEL_THRESHOLD = 81
+
+
+def convolve2d(image, kernel, mode='constant', method='auto'):
+    # Same semantics as the old per-pixel loop: the kernel is applied without
+    # flipping (correlation), the image is padded by kernel_size // 2 using
+    # np.pad `mode`, and the output has the input's height and width.
+    # A trailing channel axis is allowed; the kernel is applied to each channel.
+    kernel = np.asarray(kernel)
+    kh, kw = kernel.shape
+    if method == 'auto':
+        method = 'fft' if kh * kw > FFT_KERNEL_THRESHOLD else 'direct'
+
+    pad_h, pad_w = kh // 2, kw // 2
+    pad_width = [(pad_h, pad_h), (pad_w, pad_w)] + [(0, 0)] * (image.ndim - 2)
+    padded = np.pad(image, pad_width, mode=mode)
+
+    if method == 'direct':
+        return _convolve_direct(padded, kernel, image.shape, _work_dtype(image))
+    if method == 'fft':
+        return _convolve_fft(padded, kernel, image.shape, _work_dtype(image))
+    raise ValueError(f"Unknown convolution method: {method}")
+
+
+def _work_dtype(image):
+    return np.promote_types(image.dtype, np.float32)
+
+
+def _convolve_direct(padded, kernel, shape, dtype):
+    h, w = shape[:2]
+    output = np.zeros(shape, dtype=dtype)
+    for i in range(kernel.shape[0]):
+        for j in range(kernel.shape[1]):
+            k = kernel[i, j]
+            if k == 0:
+                continue
+            output += k * padded[i:i+h, j:j+w]
+    return output
+
+
+def _convolve_fft(padded, kernel, shape, dtype):
+    h, w = shape[:2]
+    kh, kw = kernel.shape
+    ph, pw = padded.shape[:2]
+    # rfft2 computes a true convolution, so flip the kernel to keep the
+    # correlation semantics of the direct path.
+    flipped = kernel[::-1, ::-1]
+    if padded.ndim == 3:
+        flipped = flipped[:, :, np.newaxis]
+    spectrum = np.fft.rfft2(padded, s=(ph, pw), axes=(0, 1))
+    spectrum *= np.fft.rfft2(flipped, s=(ph, pw), axes=(0, 1))
+    full = np.fft.irfft2(spectrum, s=(ph, pw), axes=(0, 1))
+    return full[kh-1:kh-1+h, kw-1:kw-1+w].astype(dtype)
+
+
+def separable_convolve2d(image, row_kernel, col_kernel, mode='constant', out=None, scratch=None):
+    # Applies `col_kernel` down the rows and then `row_kernel` along each row,
+    # which equals convolve2d with np.outer(col_kernel, row_kernel).
+    # `out` and `scratch` are optional float32 buffers of the image's shape;
+    # passing them in lets a batch reuse the same memory for every image.
+    if out is None:
+        out = np.empty(image.shape, dtype=np.float32)
+    if scratch is None:
+        scratch = np.empty(image.shape, dtype=np.float32)
+    convolve1d(image, col_kernel, axis=0, mode=mode, out=scratch)
+    convolve1d(scratch, row_kernel, axis=1, mode=mode, out=out)
+    return out
+
+
+def convolve1d(image, kernel, axis, mode='constant', out=None):
+    # One 1-D pass along `axis`. Borders are handled without padding a copy
+    # of the image: 'constant' drops taps that fall outside, 'edge' adds them
+    # to the first/last line along the axis.
+    if mode not in ('constant', 'edge'):
+        raise ValueError(f"Unsupported padding mode for convolve1d: {mode}")
+    if out is None:
+        out = np.empty(image.shape, dtype=_work_dtype(image))
+    src = np.moveaxis(image, axis, 0)
+    dst = np.moveaxis(out, axis, 0)
+    n = src.shape[0]
+    radius = len(kernel) // 2
+
+    dst[...] = 0
+    for i, k in enumerate(np.asarray(kernel, dtype=out.dtype)):
+        if k == 0:
+            continue
+        shift = i - radius
+        lo, hi = max(0, -shift), min(n, n - shift)
+        if lo < hi:
+            dst[lo:hi] += k * src[lo+shift:hi+shift]
+        if mode == 'edge':
+            if shift < 0:
+                dst[:min(lo, n)] += k * src[0]
+            elif shift > 0:
+                dst[max(hi, 0):] += k * src[n-1]
+    return out
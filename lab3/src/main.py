@@ -1,68 +1,107 @@
+import os
 import sys
+import itertools
 import numpy as np
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QFormLayout,
     QPushButton, QFileDialog, QLabel, QComboBox, QGroupBox, QMessageBox,
-    QSpinBox, QDoubleSpinBox, QCheckBox
+    QSpinBox, QDoubleSpinBox, QCheckBox, QProgressBar
 )
 from PyQt5.QtGui import QImage, QPixmap
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal
 from PIL import Image
 
+from convolution import convolve2d, separable_convolve2d
+from stage_cache import DEFAULT_MAX_BYTES, StageCache, cached
 
-def rgb_to_hsv(rgb):
-    rgb = rgb.astype(np.float32) / 255.0
-    r, g, b = rgb[:, :, 0], rgb[:, :, 1], rgb[:, :, 2]
-    mx = np.max(rgb, axis=2)
-    mn = np.min(rgb, axis=2)
-    df = mx - mn
-
-    h = np.zeros_like(mx)
-    mask = df != 0
-    h[mask & (mx == r)] = (60 * ((g - b) / df) % 6)[mask & (mx == r)]
-    h[mask & (mx == g)] = (60 * ((b - r) / df) + 120)[mask & (mx == g)]
-    h[mask & (mx == b)] = (60 * ((r - g) / df) + 240)[mask & (mx == b)]
-    h = np.clip(h, 0, 360)
-
-    s = np.zeros_like(mx)
-    s[mask] = df[mask] / mx[mask]
-    s = np.clip(s, 0, 1)
-
-    v = mx
-    hsv = np.stack([h, s * 255, v * 255], axis=2)
-    return hsv.astype(np.uint8)
-
-
-def hsv_to_rgb(hsv):
-    h, s, v = hsv[:, :, 0].astype(np.float32), hsv[:, :, 1].astype(np.float32) / 255.0, hsv[:, :, 2].astype(np.float32) / 255.0
-    c = v * s
-    x = c * (1 - np.abs((h / 60) % 2 - 1))
-    m = v - c
-
-    rgb = np.zeros((h.shape[0], h.shape[1], 3), dtype=np.float32)
-    mask = (h >= 0) & (h < 60)
-    rgb[mask] = np.stack([c[mask], x[mask], np.zeros_like(c[mask])], axis=1)
-    mask = (h >= 60) & (h < 120)
-    rgb[mask] = np.stack([x[mask], c[mask], np.zeros_like(c[mask])], axis=1)
-    mask = (h >= 120) & (h < 180)
-    rgb[mask] = np.stack([np.zeros_like(c[mask]), c[mask], x[mask]], axis=1)
-    mask = (h >= 180) & (h < 240)
-    rgb[mask] = np.stack([np.zeros_like(c[mask]), x[mask], c[mask]], axis=1)
-    mask = (h >= 240) & (h < 300)
-    rgb[mask] = np.stack([x[mask], np.zeros_like(c[mask]), c[mask]], axis=1)
-    mask = (h >= 300) & (h <= 360)
-    rgb[mask] = np.stack([c[mask], np.zeros_like(c[mask]), x[mask]], axis=1)
-
-    rgb = (rgb + m[:, :, np.newaxis]) * 255
-    return np.clip(rgb, 0, 255).astype(np.uint8)
-
-
-def linear_contrast(img):
+
+# Delay after the last parameter change before the preview is recomputed.
+PREVIEW_DELAY_MS = 300
+
+
+class Cancelled(Exception):
+    # Raised by a progress callback to abandon the running job.
+    pass
+
+
+def progress_range(progress, start, end):
+    # Maps a stage's own 0..1 progress into [start, end] of the whole job.
+    if progress is None:
+        return None
+    return lambda fraction: progress(start + (end - start) * fraction)
+
+
+def rgb_to_hsv(rgb, out=None):
+    # H in degrees [0, 360), S and V scaled to [0, 255]; float32 so the hue
+    # survives a round trip through hsv_to_rgb.
+    h, w = rgb.shape[:2]
+    if out is None:
+        out = np.empty((h, w, 3), dtype=np.float32)
+    hue, sat, val = out[:, :, 0], out[:, :, 1], out[:, :, 2]
+
+    mx_idx = np.argmax(rgb, axis=2).astype(np.uint8)[:, :, np.newaxis]
+    mx = np.take_along_axis(rgb, mx_idx, axis=2)[:, :, 0]
+    nxt = np.take_along_axis(rgb, (mx_idx + 1) % 3, axis=2)[:, :, 0]
+    prv = np.take_along_axis(rgb, (mx_idx + 2) % 3, axis=2)[:, :, 0]
+    val[...] = mx
+    np.subtract(val, rgb.min(axis=2), out=sat)
+
+    # For the dominant channel c the hue is 60 * (2c + (next - prev) / df),
+    # which covers the three sector formulas in a single expression.
+    np.subtract(nxt, prv, out=hue, dtype=np.float32)
+    np.divide(hue, sat, out=hue, where=sat > 0)
+    hue[sat == 0] = 0
+    hue += 2 * mx_idx[:, :, 0]
+    hue *= 60
+    hue %= 360
+
+    np.divide(sat, val, out=sat, where=val > 0)
+    sat *= 255
+    return out
+
+
+def hsv_to_rgb(hsv, out=None):
+    h, w = hsv.shape[:2]
+    if out is None:
+        out = np.empty((h, w, 3), dtype=np.uint8)
+    hue = hsv[:, :, 0].astype(np.float32) / 60
+    val = hsv[:, :, 2].astype(np.float32)
+    chroma = val * (hsv[:, :, 1].astype(np.float32) / 255)
+
+    # Channel n of RGB is V - C * clamp(min(k, 4 - k), 0, 1) with
+    # k = (n + H / 60) mod 6 and n = 5, 3, 1 for R, G, B.
+    k = np.empty_like(hue)
+    t = np.empty_like(hue)
+    for c, n in enumerate((5, 3, 1)):
+        np.add(hue, n, out=k)
+        k %= 6
+        np.subtract(4, k, out=t)
+        np.minimum(k, t, out=t)
+        np.clip(t, 0, 1, out=t)
+        t *= chroma
+        np.subtract(val, t, out=t)
+        np.clip(t, 0, 255, out=t)
+        np.rint(t, out=t)
+        out[:, :, c] = t
+    return out
+
+
+def channel_bounds(img):
+    # (min, max) of every channel, as the float32 values linear_contrast uses.
+    channels = [img[:, :, c] for c in range(3)] if img.ndim == 3 else [img]
+    return [(np.float32(ch.min()), np.float32(ch.max())) for ch in channels]
+
+
+def linear_contrast(img, bounds=None):
+    # `bounds` defaults to channel_bounds(img); tiled processing passes the
+    # whole image's bounds so every band is stretched the same way.
+    if bounds is None:
+        bounds = channel_bounds(img)
     if img.ndim == 3:
         out = np.zeros_like(img)
         for c in range(3):
             channel = img[:, :, c].astype(np.float32)
-            min_val, max_val = channel.min(), channel.max()
+            min_val, max_val = bounds[c]
             if max_val == min_val:
                 out[:, :, c] = channel
             else:
@@ -70,19 +109,30 @@ def linear_contrast(img):
         return np.clip(out, 0, 255).astype(np.uint8)
     else:
         img = img.astype(np.float32)
-        min_val, max_val = img.min(), img.max()
+        min_val, max_val = bounds[0]
         if max_val == min_val:
             return img.astype(np.uint8)
         stretched = 255 * (img - min_val) / (max_val - min_val)
         return np.clip(stretched, 0, 255).astype(np.uint8)
 
 
-def hist_equalize_grayscale(gray):
+def gray_histogram(gray):
     hist, _ = np.histogram(gray.flatten(), bins=256, range=(0, 256))
+    return hist
+
+
+def equalization_lut(gray):
+    return histogram_lut(gray_histogram(gray))
+
+
+def histogram_lut(hist):
     cdf = hist.cumsum()
     cdf_normalized = (cdf - cdf.min()) * 255 / (cdf.max() - cdf.min())
-    cdf_normalized = np.ma.filled(np.ma.masked_less(cdf_normalized, 0), 0).astype(np.uint8)
-    return cdf_normalized[gray]
+    return np.ma.filled(np.ma.masked_less(cdf_normalized, 0), 0).astype(np.uint8)
+
+
+def hist_equalize_grayscale(gray):
+    return equalization_lut(gray)[gray]
 
 
 def hist_equalize_rgb(img):
@@ -92,12 +142,25 @@ def hist_equalize_rgb(img):
     return out
 
 
-def hist_equalize_hsv(img):
-    hsv = rgb_to_hsv(img)
-    h, s, v = hsv[:, :, 0], hsv[:, :, 1], hsv[:, :, 2]
-    v_eq = hist_equalize_grayscale(v)
-    hsv_eq = np.stack([h, s, v_eq], axis=2)
-    return hsv_to_rgb(hsv_eq)
+def hist_equalize_hsv(img, lut=None):
+    # Equalizing V = max(R, G, B) with H and S fixed is the same as scaling
+    # all three channels by V_eq / V, so the image never goes through HSV.
+    # `lut` defaults to the equalization LUT of this image's V.
+    v = img.max(axis=2)
+    if lut is None:
+        lut = equalization_lut(v)
+    lut = lut.astype(np.float32)
+    scale = lut[v]
+    np.divide(scale, v, out=scale, where=v > 0)
+
+    out = np.empty_like(img)
+    channel = np.empty(v.shape, dtype=np.float32)
+    for c in range(3):
+        np.multiply(img[:, :, c], scale, out=channel)
+        np.clip(channel, 0, 255, out=channel)
+        np.rint(channel, out=channel)
+        out[:, :, c] = channel
+    return out
 
 
 def grayscale(img):
@@ -106,98 +169,301 @@ def grayscale(img):
     return img
 
 
-def sobel_edge(gray):
+def sobel_gradients(gray, mode='constant'):
+    # `mode` pads the image as in np.pad; with the zero padding of the edge
+    # detector the image frame itself shows up as an edge.
     Kx = np.array([[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]])
     Ky = np.array([[1, 2, 1], [0, 0, 0], [-1, -2, -1]])
 
-    h, w = gray.shape
-    pad = 1
-    padded = np.pad(gray, pad, mode='constant')
-    Gx = np.zeros_like(gray, dtype=np.float32)
-    Gy = np.zeros_like(gray, dtype=np.float32)
+    Gx = convolve2d(gray, Kx, mode=mode)
+    Gy = convolve2d(gray, Ky, mode=mode)
+    return Gx, Gy
 
-    
-    for i in range(1, h+1):
-        for j in range(1, w+1):
-            region = padded[i-1:i+2, j-1:j+2]
-            Gx[i-1, j-1] = np.sum(Kx * region)
-            Gy[i-1, j-1] = np.sum(Ky * region)
-
-    mag = np.hypot(Gx, Gy)
-    if mag.max() == 0:
+
+def sobel_edge(gray):
+    Gx, Gy = sobel_gradients(gray)
+    return normalize_magnitude(np.hypot(Gx, Gy))
+
+
+def normalize_magnitude(mag, peak=None):
+    # Scales so that `peak` (by default mag.max()) becomes 255.
+    if peak is None:
+        peak = mag.max()
+    if peak == 0:
         return np.zeros_like(mag, dtype=np.uint8)
-    mag = mag / mag.max() * 255
+    mag = mag / peak * 255
     return mag.astype(np.uint8)
 
 
 def detect_edges(img, low=50, high=150, use_hysteresis=True):
-    gray = grayscale(img)
-    edges = sobel_edge(gray)
-    
-    
+    return threshold_edges(edge_magnitude(img), low, high, use_hysteresis)
+
+
+def edge_magnitude(img):
+    return sobel_edge(grayscale(img))
+
+
+def threshold_edges(edges, low, high, use_hysteresis=True):
     final = np.zeros_like(edges)
     
-    
-    strong = edges >= high
-    final[strong] = 255
-    
     if use_hysteresis and low < high:
-        
-        weak = (edges >= low) & (edges < high)
-        
-        h, w = edges.shape
-        for i in range(1, h-1):
-            for j in range(1, w-1):
-                if weak[i, j] and np.any(strong[i-1:i+2, j-1:j+2]):
-                    final[i, j] = 255
+        final[hysteresis_threshold(edges, low, high)] = 255
     else:
-        final[edges >= low] = 255
+        # With low >= high every pixel >= high is strong, so >= min() of
+        # the two is an edge.
+        final[edges >= min(low, high)] = 255
         
     return final
 
 
+def hysteresis_threshold(edges, low, high):
+    # Keeps every pixel >= low that is 8-connected, through other such
+    # pixels, to at least one pixel >= high.
+    from scipy.ndimage import label
+    candidates = edges >= low
+    labels, num = label(candidates, structure=np.ones((3, 3), dtype=bool))
+    if num == 0:
+        return candidates
+    has_strong = np.zeros(num + 1, dtype=bool)
+    has_strong[labels[edges >= high]] = True
+    has_strong[0] = False
+    return has_strong[labels]
+
+
+def canny_edges(img, low=30, high=90, sigma=1.4):
+    return threshold_edges(canny_nms(img, sigma), low, high)
+
+
+def canny_nms(img, sigma=1.4):
+    # Canny up to non-maximum suppression: thin normalized magnitudes.
+    gray = grayscale(img)
+    radius = max(1, int(np.ceil(3 * sigma)))
+    ax = np.arange(-radius, radius + 1, dtype=np.float64)
+    kernel = np.exp(-ax**2 / (2 * sigma**2))
+    kernel /= np.sum(kernel)
+    smoothed = separable_convolve2d(gray, kernel, kernel, mode='edge')
+
+    # Padded like the smoothing, so the frame is not an edge.
+    Gx, Gy = sobel_gradients(smoothed, mode='edge')
+    mag = normalize_magnitude(np.hypot(Gx, Gy))
+    return non_maximum_suppression(mag, Gx, Gy)
+
+
+def non_maximum_suppression(mag, Gx, Gy):
+    # Keeps pixels that are a maximum along their gradient direction,
+    # quantized to 0/45/90/135 degrees; ties keep the pixel on the "ahead"
+    # side so plateaus stay one pixel wide. Sobel Gy points up, so it is
+    # negated to get the direction in row/column order.
+    h, w = mag.shape
+    angle = np.rad2deg(np.arctan2(-Gy, Gx)) % 180
+    sector = (((angle + 22.5) // 45) % 4).astype(np.uint8)
+    padded = np.pad(mag, 1, mode='constant')
+
+    keep = np.zeros((h, w), dtype=bool)
+    for s, (dy, dx) in enumerate([(0, 1), (1, 1), (1, 0), (1, -1)]):
+        ahead = padded[1+dy:1+dy+h, 1+dx:1+dx+w]
+        behind = padded[1-dy:1-dy+h, 1-dx:1-dx+w]
+        keep |= (sector == s) & (mag >= ahead) & (mag > behind)
+    return np.where(keep, mag, 0).astype(mag.dtype)
+
+
 def overlay_edges(img, edges):
     out = img.copy()
     out[edges == 255] = [0, 0, 255]
     return out
 
 
-def hough_line_transform(edges, angle_step=1, threshold=100, min_line_length=50, max_line_gap=10):
-    h, w = edges.shape
+def hough_line_transform(edges, angle_step=1, threshold=100, min_line_length=50, max_line_gap=10,
+                         chunk_size=4096, nms_size=5, progress=None):
+    thetas, rhos, accumulator = hough_accumulator(edges, angle_step, chunk_size, progress)
+    return hough_peaks(accumulator, rhos, thetas, threshold, nms_size)
+
+
+def hough_accumulator(edges, angle_step=1, chunk_size=4096, progress=None):
+    thetas, rhos = hough_axes(edges.shape, angle_step)
+    accumulator = np.zeros(len(rhos) * len(thetas), dtype=np.int64)
+    y_idxs, x_idxs = np.nonzero(edges)
+    hough_vote(accumulator, thetas, rhos, y_idxs, x_idxs, chunk_size, progress)
+    return thetas, rhos, accumulator.reshape(len(rhos), len(thetas)).astype(np.int32)
+
+
+def hough_axes(shape, angle_step=1):
+    h, w = shape[:2]
     diag = int(np.ceil(np.sqrt(h**2 + w**2)))
     thetas = np.deg2rad(np.arange(-90, 90, angle_step))
-    rhos = np.linspace(-diag, diag, diag*2)
+    rhos = np.arange(-diag, diag, dtype=np.float64)
+    return thetas, rhos
+
+
+def hough_vote(accumulator, thetas, rhos, y_idxs, x_idxs, chunk_size=4096, progress=None):
+    # Adds the votes of the given edge pixels to the flat int64 accumulator.
+    # Votes are cast for `chunk_size` edge pixels at a time: the whole
+    # (pixels x thetas) rho matrix of a chunk is binned with one bincount,
+    # so memory stays bounded by chunk_size * len(thetas).
+    num_bins = len(rhos) * len(thetas)
+    for start in range(0, len(x_idxs), chunk_size):
+        flat = hough_bins(thetas, rhos, y_idxs[start:start+chunk_size], x_idxs[start:start+chunk_size])
+        accumulator += np.bincount(flat, minlength=num_bins)
+        if progress is not None:
+            progress(min(1.0, (start + chunk_size) / len(x_idxs)))
+
+
+def hough_bins(thetas, rhos, y_idxs, x_idxs):
+    # Flat accumulator indices of the votes of the given edge pixels.
+    diag = len(rhos) // 2
+    x = x_idxs[:, np.newaxis]
+    y = y_idxs[:, np.newaxis]
+    rho_idxs = np.rint(x * np.cos(thetas) + y * np.sin(thetas)).astype(np.intp) + diag
+    valid = (rho_idxs >= 0) & (rho_idxs < len(rhos))
+    return (rho_idxs * len(thetas) + np.arange(len(thetas)))[valid]
 
-    cos_t = np.cos(thetas)
-    sin_t = np.sin(thetas)
-    num_thetas = len(thetas)
 
-    accumulator = np.zeros((len(rhos), num_thetas), dtype=np.int32)
+def hough_peaks(accumulator, rhos, thetas, threshold=100, nms_size=5):
+    peaks = accumulator >= threshold
+    if nms_size > 1 and peaks.any():
+        from scipy.ndimage import maximum_filter
+        # theta = -90 deg and theta = 90 deg are the same line with rho
+        # negated, so the window has to wrap around the theta axis: pad each
+        # side with the opposite edge columns flipped along rho (rho index i
+        # becomes 2*diag - i; index 0 has no counterpart).
+        pad = min(nms_size // 2, accumulator.shape[1])
+        flipped = np.zeros_like(accumulator)
+        flipped[1:] = accumulator[:0:-1]
+        padded = np.concatenate([flipped[:, -pad:], accumulator, flipped[:, :pad]], axis=1)
+        local_max = maximum_filter(padded, size=nms_size, mode='constant')
+        peaks &= accumulator == local_max[:, pad:pad + accumulator.shape[1]]
+
+    rho_idxs, theta_idxs = np.nonzero(peaks)
+    order = np.argsort(-accumulator[rho_idxs, theta_idxs], kind='stable')
+    return [(rhos[r], thetas[t]) for r, t in zip(rho_idxs[order], theta_idxs[order])]
+
+
+def probabilistic_hough_line(edges, angle_step=1, threshold=100, min_line_length=50, max_line_gap=10,
+                             seed=None, progress=None, batch_size=256):
+    # Progressive probabilistic Hough transform: edge pixels vote in random
+    # order, `batch_size` at a time (one np.add.at per batch), and every
+    # cell a batch lifts to `threshold` has its line traced in the edge map.
+    # Pixels on the traced segment are removed (and their votes withdrawn),
+    # so most edge pixels of a detected line never vote at all.
+    thetas, rhos = hough_axes(edges.shape, angle_step)
+    num_thetas = len(thetas)
+    accumulator = np.zeros(len(rhos) * num_thetas, dtype=np.int64)
+    # A cell needs at least one vote to have a line.
+    threshold = max(threshold, 1)
 
     y_idxs, x_idxs = np.nonzero(edges)
-    for i in range(len(x_idxs)):
-        x = x_idxs[i]
-        y = y_idxs[i]
-        for t_idx in range(num_thetas):
-            rho = x * cos_t[t_idx] + y * sin_t[t_idx]
-            rho_idx = int(round(rho)) + diag
-            if 0 <= rho_idx < len(rhos):
-                accumulator[rho_idx, t_idx] += 1
-
-    lines = []
-    for rho_idx in range(accumulator.shape[0]):
-        for theta_idx in range(accumulator.shape[1]):
-            if accumulator[rho_idx, theta_idx] >= threshold:
-                rho = rhos[rho_idx]
-                theta = thetas[theta_idx]
-                lines.append((rho, theta))
-                
-    return lines
+    alive = np.ones(len(x_idxs), dtype=bool)
+    voted = np.zeros(len(x_idxs), dtype=bool)
+    order = np.random.default_rng(seed).permutation(len(x_idxs))
 
+    segments = []
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start+batch_size]
+        batch = batch[alive[batch]]
+        cells = hough_bins(thetas, rhos, y_idxs[batch], x_idxs[batch])
+        np.add.at(accumulator, cells, 1)
+        voted[batch] = True
 
-def draw_lines(img, lines, min_length=50):
+        # Each traced line withdraws at least one vote from its cell, so
+        # this ends with every cell below the threshold again.
+        while len(cells):
+            best = cells[np.argmax(accumulator[cells])]
+            if accumulator[best] < threshold:
+                break
+            rho_idx, theta_idx = divmod(best, num_thetas)
+            segment, removed = _trace_line(y_idxs, x_idxs, alive, voted, thetas, rhos,
+                                           rho_idx, theta_idx, max_line_gap)
+            alive[removed] = False
+            removed = removed[voted[removed]]
+            np.subtract.at(accumulator, hough_bins(thetas, rhos, y_idxs[removed], x_idxs[removed]), 1)
+            (x1, y1), (x2, y2) = segment
+            if max(abs(x2 - x1), abs(y2 - y1)) >= min_line_length:
+                segments.append(segment)
+        if progress is not None:
+            progress(min(1.0, (start + batch_size) / len(order)))
+
+    return segments
+
+
+def _trace_line(y_idxs, x_idxs, alive, voted, thetas, rhos, rho_idx, theta_idx, max_line_gap,
+                tolerance=1.0, refits=8):
+    # The segment of remaining edge pixels along the line of an accumulator
+    # cell, and the indices of its pixels. The cell only fixes the line to
+    # within the angle step, which over a long line drifts by several
+    # pixels, so the line is refitted (principal axis) to the pixels found
+    # and the search repeated until it stops growing. The run of pixels
+    # within `tolerance` of the line without a gap longer than max_line_gap
+    # that holds most of the cell's voters is the segment.
+    diag = len(rhos) // 2
+    theta = thetas[theta_idx]
+    candidates = np.flatnonzero(alive)
+    ys, xs = y_idxs[candidates], x_idxs[candidates]
+    cell_rhos = np.rint(xs * np.cos(theta) + ys * np.sin(theta)).astype(np.intp) + diag
+    voters = voted[candidates] & (cell_rhos == rho_idx)
+    center = np.array([xs[voters].mean(), ys[voters].mean()])
+    direction = np.array([-np.sin(theta), np.cos(theta)])
+
+    run = voters
+    for _ in range(refits):
+        offsets = np.stack([xs, ys], axis=1) - center
+        normal = np.array([-direction[1], direction[0]])
+        near = np.flatnonzero(np.abs(offsets @ normal) <= tolerance)
+        # Positions in steps along the major axis, as the gap is counted.
+        t = offsets[near] @ direction / np.abs(direction).max()
+        sort = np.argsort(t, kind='stable')
+        near, t = near[sort], t[sort]
+        breaks = np.flatnonzero(np.diff(t) > max_line_gap + 1) + 1
+        runs = np.split(near, breaks)
+        new_run = np.zeros_like(voters)
+        new_run[max(runs, key=lambda r: np.count_nonzero(voters[r]))] = True
+        if not (new_run & voters).any():
+            # The line lost the voters; remove just them, as a short line.
+            run = voters
+            break
+        if (new_run == run).all():
+            break
+        run = new_run
+        points = np.stack([xs[run], ys[run]], axis=1).astype(np.float64)
+        if len(points) < 2:
+            break
+        center = points.mean(axis=0)
+        _, vectors = np.linalg.eigh(np.cov(points, rowvar=False))
+        direction = vectors[:, -1]
+
+    run_xs, run_ys = xs[run], ys[run]
+    t = (np.stack([run_xs, run_ys], axis=1) - center) @ direction
+    first, last = np.argmin(t), np.argmax(t)
+    segment = ((int(run_xs[first]), int(run_ys[first])), (int(run_xs[last]), int(run_ys[last])))
+    return segment, candidates[run]
+
+
+def _segment_pixels(x1, y1, x2, y2):
+    n = max(abs(x2 - x1), abs(y2 - y1)) + 1
+    xs = np.rint(np.linspace(x1, x2, n)).astype(np.intp)
+    ys = np.rint(np.linspace(y1, y2, n)).astype(np.intp)
+    return ys, xs
+
+
+def draw_segments(img, segments):
     out = img.copy()
-    h, w = img.shape[:2]
+    paint_segments(out, segments)
+    return out
+
+
+def paint_segments(out, segments):
+    h, w = out.shape[:2]
+    for (x1, y1), (x2, y2) in segments:
+        ys, xs = _segment_pixels(x1, y1, x2, y2)
+        inside = (xs >= 0) & (xs < w) & (ys >= 0) & (ys < h)
+        out[ys[inside], xs[inside]] = [0, 255, 0]
+
+
+def draw_lines(img, lines, min_length=50):
+    return draw_segments(img, line_segments(lines, min_length))
+
+
+def line_segments(lines, min_length=50):
+    segments = []
     for rho, theta in lines:
         a = np.cos(theta)
         b = np.sin(theta)
@@ -212,33 +478,15 @@ def draw_lines(img, lines, min_length=50):
         length = np.sqrt((x2-x1)**2 + (y2-y1)**2)
         if length < min_length:
             continue
-            
-        rr, cc = [], []
-        dx = abs(x2 - x1)
-        dy = abs(y2 - y1)
-        sx = 1 if x1 < x2 else -1
-        sy = 1 if y1 < y2 else -1
-        err = dx - dy
-        x, y = x1, y1
-        while True:
-            if 0 <= x < w and 0 <= y < h:
-                rr.append(y)
-                cc.append(x)
-            if x == x2 and y == y2:
-                break
-            e2 = 2 * err
-            if e2 > -dy:
-                err -= dy
-                x += sx
-            if e2 < dx:
-                err += dx
-                y += sy
-        if len(rr) > 0:
-            out[rr, cc] = [0, 255, 0]
-    return out
+        segments.append(((x1, y1), (x2, y2)))
+    return segments
 
 
 def harris_corner(img, k=0.04, threshold=0.01, min_distance=10):
+    return harris_peaks(harris_response(img, k), threshold, min_distance).astype(np.uint8)
+
+
+def harris_response(img, k=0.04):
     gray = grayscale(img).astype(np.float32)
     Ix = np.zeros_like(gray)
     Iy = np.zeros_like(gray)
@@ -262,10 +510,14 @@ def harris_corner(img, k=0.04, threshold=0.01, min_distance=10):
 
     det = Sxx * Syy - Sxy ** 2
     trace = Sxx + Syy
-    R = det - k * (trace ** 2)
+    return det - k * (trace ** 2)
 
-    
-    corners = R > (threshold * R.max())
+
+def harris_peaks(R, threshold=0.01, min_distance=10, peak=None):
+    # `peak` defaults to R.max(); tiled processing passes the whole image's.
+    if peak is None:
+        peak = R.max()
+    corners = R > (threshold * peak)
     
     
     if min_distance > 0:
@@ -273,34 +525,198 @@ def harris_corner(img, k=0.04, threshold=0.01, min_distance=10):
         data_max = maximum_filter(R, size=min_distance)
         corners = (R == data_max) & corners
         
-    return corners.astype(np.uint8)
-
-
-def convolve2d(image, kernel):
-    h, w = image.shape
-    kh, kw = kernel.shape
-    pad_h, pad_w = kh // 2, kw // 2
-    padded = np.pad(image, ((pad_h, pad_h), (pad_w, pad_w)), mode='constant')
-    output = np.zeros_like(image)
-    for i in range(h):
-        for j in range(w):
-            output[i, j] = np.sum(padded[i:i+kh, j:j+kw] * kernel)
-    return output
+    return corners
 
 
 def draw_points(img, points):
     out = img.copy()
-    h, w = img.shape[:2]
     y_idxs, x_idxs = np.nonzero(points)
-    for y, x in zip(y_idxs, x_idxs):
-        for dy in range(-3, 4):
-            for dx in range(-3, 4):
-                if 0 <= y+dy < h and 0 <= x+dx < w:
-                    if dx == 0 or dy == 0:
-                        out[y+dy, x+dx] = [255, 0, 0]
+    paint_points(out, y_idxs, x_idxs)
     return out
 
 
+def paint_points(out, y_idxs, x_idxs):
+    # A cross with arms of 3 pixels around every point.
+    h, w = out.shape[:2]
+    for dy, dx in [(d, 0) for d in range(-3, 4)] + [(0, d) for d in range(-3, 4) if d]:
+        ys, xs = y_idxs + dy, x_idxs + dx
+        inside = (ys >= 0) & (ys < h) & (xs >= 0) & (xs < w)
+        out[ys[inside], xs[inside]] = [255, 0, 0]
+
+
+def process_image(original, params, progress=None, cache=None, image_key=None):
+    # `progress`, if given, is called with the fraction of the job done
+    # between and inside the long stages; it may raise Cancelled.
+    # With a StageCache and a key identifying `original`, every stage result
+    # is looked up under the parameters it depends on, so a change to a
+    # downstream parameter reuses everything upstream of it.
+    report = progress or (lambda fraction: None)
+    run = lambda key, compute: cached(cache, image_key, key, compute)
+    contrast = params['contrast']
+    segment = params['segment']
+
+    
+    if contrast in CONTRAST_METHODS:
+        img = run(('contrast', contrast), lambda: CONTRAST_METHODS[contrast](original))
+    else:
+        img = original
+    report(0.1)
+
+    def edges_for(low, high, use_hysteresis):
+        magnitude = lambda: run(('sobel', contrast), lambda: edge_magnitude(img))
+        return run(('edges', contrast, low, high, use_hysteresis),
+                   lambda: threshold_edges(magnitude(), low, high, use_hysteresis))
+
+    def canny_for(low, high, sigma):
+        thin = lambda: run(('canny', contrast, sigma), lambda: canny_nms(img, sigma))
+        return run(('canny_edges', contrast, sigma, low, high),
+                   lambda: threshold_edges(thin(), low, high))
+
+    
+    if segment == "Перапады яркасці":
+        edges = edges_for(params['edge_low'], params['edge_high'], params['edge_hysteresis'])
+        report(0.9)
+        img = overlay_edges(img, edges)
+    elif segment == "Дэтэктар Кэні":
+        edges = canny_for(params['canny_low'], params['canny_high'], params['canny_sigma'])
+        report(0.9)
+        img = overlay_edges(img, edges)
+    elif segment == "Выяўленне ліній":
+        if params['line_canny']:
+            edges = canny_for(30, 90, params['line_canny_sigma'])
+            edge_key = ('canny_edges', contrast, params['line_canny_sigma'], 30, 90)
+        else:
+            edges = edges_for(50, 150, True)
+            edge_key = ('edges', contrast, 50, 150, True)
+        report(0.4)
+        if params['line_probabilistic']:
+            # Not cached: the transform is randomized, every run may differ.
+            segments = probabilistic_hough_line(
+                edges,
+                threshold=params['line_threshold'],
+                min_line_length=params['line_min_length'],
+                max_line_gap=params['line_max_gap'],
+                angle_step=params['line_angle_step'],
+                progress=progress_range(progress, 0.4, 0.95)
+            )
+            img = draw_segments(img, segments)
+        else:
+            # hough_line_transform in two steps: a new threshold only
+            # re-thresholds the cached accumulator.
+            thetas, rhos, accumulator = run(
+                edge_key + ('hough', params['line_angle_step']),
+                lambda: hough_accumulator(edges, params['line_angle_step'],
+                                          progress=progress_range(progress, 0.4, 0.95)))
+            lines = hough_peaks(accumulator, rhos, thetas, params['line_threshold'])
+            img = draw_lines(img, lines, min_length=params['line_min_length'])
+    elif segment == "Выяўленне кропак":
+        # harris_corner in two steps, so the job can stop between them and
+        # the response is reused when only the threshold or distance change.
+        R = run(('harris', contrast), lambda: harris_response(img))
+        report(0.7)
+        points = harris_peaks(R, threshold=params['point_threshold'],
+                              min_distance=params['point_min_distance']).astype(np.uint8)
+        report(0.9)
+        img = draw_points(img, points)
+    else:
+        # The result must not be the original or a cached array.
+        img = img.copy()
+
+    report(1.0)
+    return img
+
+
+CONTRAST_METHODS = {
+    "Лінейнае пашырэнне кантрасту": linear_contrast,
+    "Эквалізацыя гістаграмы (адценні шэрага)":
+        lambda img: np.repeat(hist_equalize_grayscale(grayscale(img))[:, :, np.newaxis], 3, axis=2),
+    "Эквалізацыя гістаграмы (RGB)": hist_equalize_rgb,
+    "Эквалізацыя гістаграмы (HSV)": hist_equalize_hsv,
+}
+
+
+def proxy_image(img, width, height):
+    # The image downscaled to fit width x height (never upscaled), and the
+    # scale factor relative to the original.
+    h, w = img.shape[:2]
+    scale = min(1.0, width / w, height / h)
+    if scale >= 1.0:
+        return img, 1.0
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    proxy = np.asarray(Image.fromarray(img).resize(size, Image.BOX))
+    return proxy, size[0] / w
+
+
+def scale_params(params, scale):
+    # Parameters measured in pixels (smoothing, lengths, gaps, distances) and
+    # the Hough vote threshold, which counts edge pixels along a line, are
+    # scaled with the image so a preview finds what the full-size run would.
+    # Thresholds on normalized magnitudes and the relative Harris threshold
+    # do not depend on the size.
+    if scale == 1.0:
+        return params
+    scaled = dict(params)
+    scaled['canny_sigma'] = params['canny_sigma'] * scale
+    scaled['line_canny_sigma'] = params['line_canny_sigma'] * scale
+    scaled['line_threshold'] = max(1, round(params['line_threshold'] * scale))
+    scaled['line_min_length'] = max(1, round(params['line_min_length'] * scale))
+    scaled['line_max_gap'] = round(params['line_max_gap'] * scale)
+    scaled['point_min_distance'] = max(1, round(params['point_min_distance'] * scale))
+    return scaled
+
+
+class ProcessingThread(QThread):
+    progress_updated = pyqtSignal(int)
+    processing_finished = pyqtSignal(object)
+    error_occurred = pyqtSignal(str)
+
+    def __init__(self, image, params, tiled=False, workers=1, preview=False, cache=None,
+                 image_key=None):
+        super().__init__()
+        self.preview = preview
+        self.image = image
+        self.params = params
+        self.tiled = tiled
+        self.workers = workers
+        self.cache = cache
+        self.image_key = image_key
+        self.is_cancelled = False
+        self.percent = -1
+
+    def cancel(self):
+        self.is_cancelled = True
+
+    def report(self, fraction):
+        # Called by the pipeline on this thread; raising here unwinds the job
+        # at its next stage, band or chunk boundary.
+        if self.is_cancelled:
+            raise Cancelled()
+        percent = int(fraction * 100)
+        if percent != self.percent:
+            self.percent = percent
+            self.progress_updated.emit(percent)
+
+    def run(self):
+        try:
+            if self.tiled or self.workers > 1:
+                # Imported here: tiling imports this module for the kernels.
+                from tiling import TILE_PIXELS, process_image_tiled
+                tile_pixels = TILE_PIXELS if self.tiled else None
+                img = process_image_tiled(self.image, self.params, tile_pixels, self.workers,
+                                          self.report, self.cache, self.image_key)
+            else:
+                img = process_image(self.image, self.params, self.report, self.cache,
+                                    self.image_key)
+        except Cancelled:
+            return
+        except Exception as e:
+            if not self.is_cancelled:
+                self.error_occurred.emit(str(e))
+            return
+        if not self.is_cancelled:
+            self.processing_finished.emit(img)
+
+
 class ImageProcessorApp(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -308,6 +724,19 @@ class ImageProcessorApp(QMainWindow):
         self.setGeometry(100, 100, 1400, 800)
         self.original_image = None
         self.current_image = None
+        # The job whose result will be shown, and finished or cancelled jobs
+        # whose threads have not stopped yet.
+        self.worker = None
+        self.stale_workers = []
+        # Downscaled copy of original_image for the preview, and the label
+        # size it was made for.
+        self.proxy = None
+        self.proxy_scale = 1.0
+        self.proxy_size = None
+        # Stage results of earlier jobs; every loaded image gets a new key.
+        self.stage_cache = StageCache()
+        self.image_keys = itertools.count()
+        self.image_key = None
         self.init_ui()
 
     def init_ui(self):
@@ -345,6 +774,7 @@ class ImageProcessorApp(QMainWindow):
         self.segment_combo.addItems([
             "Няма",
             "Перапады яркасці",
+            "Дэтэктар Кэні",
             "Выяўленне ліній",
             "Выяўленне кропак"
         ])
@@ -373,6 +803,27 @@ class ImageProcessorApp(QMainWindow):
         self.edge_param_widget = edge_widget
         
         
+        canny_form = QFormLayout()
+        self.canny_low_spin = QSpinBox()
+        self.canny_low_spin.setRange(0, 255)
+        self.canny_low_spin.setValue(30)
+        self.canny_high_spin = QSpinBox()
+        self.canny_high_spin.setRange(0, 255)
+        self.canny_high_spin.setValue(90)
+        self.canny_sigma_spin = QDoubleSpinBox()
+        self.canny_sigma_spin.setRange(0.5, 5.0)
+        self.canny_sigma_spin.setValue(1.4)
+        self.canny_sigma_spin.setSingleStep(0.1)
+        canny_form.addRow("Нізкі парог:", self.canny_low_spin)
+        canny_form.addRow("Высокі парог:", self.canny_high_spin)
+        canny_form.addRow("Сігма Гаўса:", self.canny_sigma_spin)
+        canny_widget = QWidget()
+        canny_widget.setLayout(canny_form)
+        canny_widget.hide()
+        seg_layout.addWidget(canny_widget)
+        self.canny_param_widget = canny_widget
+        
+        
         line_form = QFormLayout()
         self.line_thresh_spin = QSpinBox()
         self.line_thresh_spin.setRange(1, 500)
@@ -383,9 +834,17 @@ class ImageProcessorApp(QMainWindow):
         self.line_angle_step_spin = QSpinBox()
         self.line_angle_step_spin.setRange(1, 10)
         self.line_angle_step_spin.setValue(1)
+        self.line_max_gap_spin = QSpinBox()
+        self.line_max_gap_spin.setRange(0, 100)
+        self.line_max_gap_spin.setValue(10)
+        self.line_prob_check = QCheckBox("Імавернасны рэжым (адрэзкі)")
+        self.line_canny_check = QCheckBox("Тонкія краі (Кэні)")
         line_form.addRow("Парог Хафа:", self.line_thresh_spin)
         line_form.addRow("Мін. даўжыня:", self.line_min_len_spin)
+        line_form.addRow("Макс. разрыў:", self.line_max_gap_spin)
         line_form.addRow("Крок вугла (°):", self.line_angle_step_spin)
+        line_form.addRow("", self.line_prob_check)
+        line_form.addRow("", self.line_canny_check)
         line_widget = QWidget()
         line_widget.setLayout(line_form)
         line_widget.hide()
@@ -411,11 +870,52 @@ class ImageProcessorApp(QMainWindow):
         
         seg_group.setLayout(seg_layout)
         control_layout.addWidget(seg_group)
+
+        self.tiled_check = QCheckBox("Апрацоўка па частках (вялікія выявы)")
+        self.tiled_check.setToolTip("Выява апрацоўваецца палосамі; патрэбна менш памяці, вынік той жа. "
+                                    "Кэш этапаў у гэтым рэжыме не выкарыстоўваецца")
+        self.tiled_check.toggled.connect(self.tiled_toggled)
+        control_layout.addWidget(self.tiled_check)
+        workers_form = QFormLayout()
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, 64)
+        self.workers_spin.setValue(os.cpu_count() or 1)
+        self.workers_spin.setToolTip("Палосы выявы апрацоўваюцца паралельна ў некалькіх патоках")
+        workers_form.addRow("Колькасць патокаў:", self.workers_spin)
+        self.cache_spin = QSpinBox()
+        self.cache_spin.setRange(0, 65536)
+        self.cache_spin.setValue(DEFAULT_MAX_BYTES // 2**20)
+        self.cache_spin.setToolTip("Прамежкавыя вынікі захоўваюцца, і пры змене аднаго параметра "
+                                   "пералічваюцца толькі наступныя этапы; 0 адключае кэш")
+        self.cache_spin.valueChanged.connect(
+            lambda value: self.stage_cache.set_max_bytes(value * 2**20))
+        workers_form.addRow("Кэш этапаў (МБ):", self.cache_spin)
+        control_layout.addLayout(workers_form)
         
+        self.preview_check = QCheckBox("Папярэдні прагляд")
+        self.preview_check.setToolTip("Пры змене параметраў адразу паказваць вынік на паменшанай выяве; "
+                                      "\"Ок\" апрацоўвае выяву ў поўным памеры")
+        self.preview_check.toggled.connect(self.preview_toggled)
+        control_layout.addWidget(self.preview_check)
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(PREVIEW_DELAY_MS)
+        self.preview_timer.timeout.connect(self.run_preview)
+
         self.apply_btn = QPushButton("Ок")
         self.apply_btn.clicked.connect(self.apply_processing)
         self.apply_btn.setEnabled(False)
         control_layout.addWidget(self.apply_btn)
+
+        self.cancel_btn = QPushButton("Скасаваць")
+        self.cancel_btn.clicked.connect(self.cancel_processing)
+        self.cancel_btn.setEnabled(False)
+        control_layout.addWidget(self.cancel_btn)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setVisible(False)
+        control_layout.addWidget(self.progress_bar)
         
         control_layout.addStretch()
         main_layout.addLayout(control_layout, 1)
@@ -429,13 +929,27 @@ class ImageProcessorApp(QMainWindow):
         
         self.segment_combo.currentTextChanged.connect(self.update_param_visibility)
 
+        # A running job becomes stale as soon as a parameter changes.
+        for combo in (self.contrast_combo, self.segment_combo):
+            combo.currentIndexChanged.connect(self.parameters_changed)
+        for spin in (self.edge_low_spin, self.edge_high_spin, self.canny_low_spin,
+                     self.canny_high_spin, self.canny_sigma_spin, self.line_thresh_spin,
+                     self.line_min_len_spin, self.line_max_gap_spin, self.line_angle_step_spin,
+                     self.point_thresh_spin, self.point_min_dist_spin):
+            spin.valueChanged.connect(self.parameters_changed)
+        for check in (self.edge_hyst_check, self.line_prob_check, self.line_canny_check):
+            check.toggled.connect(self.parameters_changed)
+
     def update_param_visibility(self, method):
         self.edge_param_widget.hide()
+        self.canny_param_widget.hide()
         self.line_param_widget.hide()
         self.point_param_widget.hide()
         
         if method == "Перапады яркасці":
             self.edge_param_widget.show()
+        elif method == "Дэтэктар Кэні":
+            self.canny_param_widget.show()
         elif method == "Выяўленне ліній":
             self.line_param_widget.show()
         elif method == "Выяўленне кропак":
@@ -450,12 +964,17 @@ class ImageProcessorApp(QMainWindow):
         )
         if not path:
             return
+        self.cancel_processing()
         try:
             pil_img = Image.open(path).convert('RGB')
             self.original_image = np.array(pil_img)
+            self.image_key = next(self.image_keys)
+            self.stage_cache.clear()
+            self.proxy = None
             self.current_image = self.original_image.copy()
             self.display_image(self.original_image)
             self.apply_btn.setEnabled(True)
+            self.parameters_changed()
         except Exception as e:
             QMessageBox.critical(self, "Памылка", f"Не ўдалося загрузіць выяву:\n{e}")
 
@@ -474,54 +993,132 @@ class ImageProcessorApp(QMainWindow):
         )
         self.image_label.setPixmap(pixmap)
 
+    def pipeline_params(self):
+        return {
+            'contrast': self.contrast_combo.currentText(),
+            'segment': self.segment_combo.currentText(),
+            'edge_low': self.edge_low_spin.value(),
+            'edge_high': self.edge_high_spin.value(),
+            'edge_hysteresis': self.edge_hyst_check.isChecked(),
+            'canny_low': self.canny_low_spin.value(),
+            'canny_high': self.canny_high_spin.value(),
+            'canny_sigma': self.canny_sigma_spin.value(),
+            'line_threshold': self.line_thresh_spin.value(),
+            'line_min_length': self.line_min_len_spin.value(),
+            'line_max_gap': self.line_max_gap_spin.value(),
+            'line_angle_step': self.line_angle_step_spin.value(),
+            'line_probabilistic': self.line_prob_check.isChecked(),
+            'line_canny': self.line_canny_check.isChecked(),
+            # Smoothing of the Canny edge map used for lines (canny_edges' default).
+            'line_canny_sigma': 1.4,
+            'point_threshold': self.point_thresh_spin.value(),
+            'point_min_distance': self.point_min_dist_spin.value(),
+        }
+
     def apply_processing(self):
         if self.original_image is None:
             return
-            
-        img = self.original_image.copy()
-        contrast = self.contrast_combo.currentText()
-        segment = self.segment_combo.currentText()
 
-        
-        if contrast == "Лінейнае пашырэнне кантрасту":
-            img = linear_contrast(img)
-        elif contrast == "Эквалізацыя гістаграмы (адценні шэрага)":
-            gray = grayscale(img)
-            eq = hist_equalize_grayscale(gray)
-            img = np.stack([eq, eq, eq], axis=2)
-        elif contrast == "Эквалізацыя гістаграмы (RGB)":
-            img = hist_equalize_rgb(img)
-        elif contrast == "Эквалізацыя гістаграмы (HSV)":
-            img = hist_equalize_hsv(img)
+        self.preview_timer.stop()
+        self.start_job(self.original_image, self.pipeline_params())
 
-        
-        if segment == "Перапады яркасці":
-            low = self.edge_low_spin.value()
-            high = self.edge_high_spin.value()
-            hyst = self.edge_hyst_check.isChecked()
-            edges = detect_edges(img, low=low, high=high, use_hysteresis=hyst)
-            img = overlay_edges(img, edges)
-        elif segment == "Выяўленне ліній":
-            edges = detect_edges(img, low=50, high=150)
-            threshold = self.line_thresh_spin.value()
-            min_len = self.line_min_len_spin.value()
-            angle_step = self.line_angle_step_spin.value()
-            lines = hough_line_transform(
-                edges, 
-                threshold=threshold,
-                min_line_length=min_len,
-                angle_step=angle_step
-            )
-            img = draw_lines(img, lines, min_length=min_len)
-        elif segment == "Выяўленне кропак":
-            threshold = self.point_thresh_spin.value()
-            min_dist = self.point_min_dist_spin.value()
-            points = harris_corner(img, threshold=threshold, min_distance=min_dist)
-            img = draw_points(img, points)
-
-        self.current_image = img
+    def parameters_changed(self):
+        # Restarts the debounce timer, so the preview runs once the values
+        # stop changing.
+        self.cancel_processing()
+        if self.preview_check.isChecked() and self.original_image is not None:
+            self.preview_timer.start()
+
+    def tiled_toggled(self, checked):
+        # Full-size stage results left from earlier runs would defeat the
+        # memory limit, and tiled runs do not use them.
+        if checked:
+            self.stage_cache.clear()
+
+    def preview_toggled(self, checked):
+        if checked:
+            self.parameters_changed()
+        else:
+            self.preview_timer.stop()
+            self.cancel_processing()
+            self.display_image(self.current_image)
+
+    def run_preview(self):
+        if self.original_image is None or not self.preview_check.isChecked():
+            return
+        size = (self.image_label.width(), self.image_label.height())
+        if self.proxy is None or self.proxy_size != size:
+            self.proxy, self.proxy_scale = proxy_image(self.original_image, *size)
+            self.proxy_size = size
+        self.start_job(self.proxy, scale_params(self.pipeline_params(), self.proxy_scale),
+                       preview=True)
+
+    def start_job(self, image, params, preview=False):
+        self.cancel_processing()
+        # The proxy is small enough to process without the memory limit.
+        tiled = self.tiled_check.isChecked() and not preview
+        # The proxy's stages are cached apart from the full-size image's.
+        image_key = (self.image_key, 'proxy', self.proxy_size) if preview else self.image_key
+        worker = ProcessingThread(image, params, tiled, self.workers_spin.value(), preview,
+                                  self.stage_cache, image_key)
+        worker.progress_updated.connect(self.update_progress)
+        worker.processing_finished.connect(self.processing_finished)
+        worker.error_occurred.connect(self.processing_error)
+        worker.finished.connect(self.worker_stopped)
+        self.worker = worker
+        self.set_busy(True)
+        worker.start()
+
+    def cancel_processing(self):
+        # The job stops at its next progress check; anything it still emits
+        # is ignored because it is no longer self.worker.
+        if self.worker is None:
+            return
+        self.worker.cancel()
+        self.retire_worker()
+
+    def retire_worker(self):
+        # The thread may still be running (e.g. just after emitting its
+        # result), so it is kept referenced until its finished signal.
+        self.stale_workers.append(self.worker)
+        self.worker = None
+        self.set_busy(False)
+
+    def set_busy(self, busy):
+        self.cancel_btn.setEnabled(busy)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(busy)
+
+    def update_progress(self, percent):
+        if self.sender() is self.worker:
+            self.progress_bar.setValue(percent)
+
+    def processing_finished(self, img):
+        worker = self.sender()
+        if worker is not self.worker:
+            return
+        self.retire_worker()
+        # A preview is only shown; current_image stays the last full-size result.
+        if not worker.preview:
+            self.current_image = img
         self.display_image(img)
 
+    def processing_error(self, message):
+        if self.sender() is not self.worker:
+            return
+        self.retire_worker()
+        QMessageBox.critical(self, "Памылка", f"Не ўдалося апрацаваць выяву:\n{message}")
+
+    def worker_stopped(self):
+        worker = self.sender()
+        if worker in self.stale_workers:
+            self.stale_workers.remove(worker)
+
+    def closeEvent(self, event):
+        self.cancel_processing()
+        for worker in list(self.stale_workers):
+            worker.wait()
+        super().closeEvent(event)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -0,0 +1,68 @@
+import os
+import json
+import hashlib
+
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+# The manifest lives next to the generated files and has two tables:
+#   sources: input path -> {"size", "mtime_ns", "sha256"} of the original
+#   outputs: output file name -> {"source", "degradation", "params"}
+# An output is valid when its entry matches the current source hash and
+# degradation parameters and the file still exists. Entries are added only
+# after the output has been fully written, so an interrupted run simply
+# leaves the unfinished outputs unlisted and they are regenerated next time.
+
+
+def empty_manifest():
+    return {"version": MANIFEST_VERSION, "sources": {}, "outputs": {}}
+
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return empty_manifest()
+    if manifest.get("version") != MANIFEST_VERSION:
+        return empty_manifest()
+    manifest.setdefault("sources", {})
+    manifest.setdefault("outputs", {})
+    return manifest
+
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def file_sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def source_record(stat, sha256):
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+
+
+def cached_source_hash(manifest, input_path, stat):
+    # Hash recorded for an unchanged (same size and mtime) source, else None.
+    record = manifest["sources"].get(input_path)
+    if record and record["size"] == stat.st_size and record["mtime_ns"] == stat.st_mtime_ns:
+        return record["sha256"]
+    return None
+
+
+def output_entry(source_hash, degradation, params):
+    return {"source": source_hash, "degradation": degradation, "params": dict(params)}
+
+
+def output_is_current(entry, expected, output_path):
+    return entry == expected and os.path.exists(output_path)
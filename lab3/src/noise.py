@@ -1,15 +1,24 @@
+import io
 import os
+import time
+import argparse
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from PIL import Image
 from pathlib import Path
 
+from convolution import separable_convolve2d
+from manifest import (
+    empty_manifest, load_manifest, save_manifest, file_sha256, source_record,
+    cached_source_hash, output_entry, output_is_current
+)
+
 
 INPUT_DIR = "input_images"      
 OUTPUT_DIR = "test_dataset"     
 
 
-Path(OUTPUT_DIR).mkdir(exist_ok=True)
-
 def add_gaussian_noise(img, sigma=25):
     
     img_array = np.array(img, dtype=np.float32)
@@ -17,35 +26,28 @@ def add_gaussian_noise(img, sigma=25):
     noisy = img_array + noise
     return Image.fromarray(np.clip(noisy, 0, 255).astype(np.uint8))
 
-def gaussian_blur(img, kernel_size=15, sigma=3.0):
-    
-    def gaussian_kernel(size, sigma):
-        ax = np.arange(-size // 2 + 1., size // 2 + 1.)
-        xx, yy = np.meshgrid(ax, ax)
-        kernel = np.exp(-(xx**2 + yy**2) / (2 * sigma**2))
-        return kernel / np.sum(kernel)
-    
-    img_array = np.array(img)
-    kernel = gaussian_kernel(kernel_size, sigma)
-    pad = kernel_size // 2
-    if img_array.ndim == 3:
-        blurred = np.zeros_like(img_array)
-        for c in range(3):
-            padded = np.pad(img_array[:, :, c], pad, mode='edge')
-            for i in range(img_array.shape[0]):
-                for j in range(img_array.shape[1]):
-                    blurred[i, j, c] = np.sum(
-                        padded[i:i+kernel_size, j:j+kernel_size] * kernel
-                    )
-    else:
-        padded = np.pad(img_array, pad, mode='edge')
-        blurred = np.zeros_like(img_array)
-        for i in range(img_array.shape[0]):
-            for j in range(img_array.shape[1]):
-                blurred[i, j] = np.sum(
-                    padded[i:i+kernel_size, j:j+kernel_size] * kernel
-                )
-    return Image.fromarray(np.clip(blurred, 0, 255).astype(np.uint8))
+def gaussian_blur(img, kernel_size=15, sigma=3.0, buffer=None):
+    
+    ax = np.arange(-kernel_size // 2 + 1., kernel_size // 2 + 1.)
+    kernel = np.exp(-ax**2 / (2 * sigma**2))
+    kernel /= np.sum(kernel)
+
+    img_array = np.asarray(img)
+    buffer = blur_buffer(img_array.shape, buffer)
+    out, scratch = buffer[0], buffer[1]
+    separable_convolve2d(img_array, kernel, kernel, mode='edge', out=out, scratch=scratch)
+    np.clip(out, 0, 255, out=out)
+    return Image.fromarray(out.astype(np.uint8))
+
+def blur_buffer(shape, buffer=None):
+    
+    # Two float32 planes (output + intermediate pass) for gaussian_blur.
+    # A buffer that is already large enough is reused as-is, so keeping one
+    # sized for the largest image avoids reallocating across a batch.
+    size = int(np.prod(shape))
+    if buffer is None or buffer.dtype != np.float32 or buffer.size < 2 * size:
+        buffer = np.empty(2 * size, dtype=np.float32)
+    return buffer.reshape(-1)[:2 * size].reshape((2,) + tuple(shape))
 
 def reduce_contrast(img, factor=0.3):
     
@@ -66,55 +68,199 @@ def overexpose_image(img, factor=1.8):
     over = img_array * factor
     return Image.fromarray(np.clip(over, 0, 255).astype(np.uint8))
 
-def process_image(input_path, output_dir):
+DEGRADATIONS = [
+    ("noisy", add_gaussian_noise, {"sigma": 30}),
+    ("blurred", gaussian_blur, {"kernel_size": 15, "sigma": 2.5}),
+    ("low_contrast", reduce_contrast, {"factor": 0.4}),
+    ("dark", darken_image, {"factor": 0.3}),
+    ("overexposed", overexpose_image, {"factor": 2.0}),
+]
+
+_blur_buffer = None
+
+def _worker_blur_buffer(shape):
     
+    # One float32 buffer per process, grown to the largest image seen so far.
+    global _blur_buffer
+    needed = 2 * int(np.prod(shape))
+    if _blur_buffer is None or _blur_buffer.size < needed:
+        _blur_buffer = np.empty(needed, dtype=np.float32)
+    return _blur_buffer
+
+def output_name(name, suffix):
+    
+    return f"{name}_{suffix}.jpg"
+
+def process_image(input_path, output_dir, previous=None):
+    
+    # `previous` maps output file names to their manifest entries; outputs
+    # whose entry still matches the source hash and parameters are skipped.
+    previous = previous or {}
+    name = Path(input_path).stem
+    stats = {"name": name, "path": input_path, "ok": False, "pixels": 0,
+             "decode": 0.0, "degrade": 0.0, "encode": 0.0, "error": None,
+             "source": None, "outputs": {}, "skipped": 0}
     try:
-        original = Image.open(input_path).convert('RGB')
-        name = Path(input_path).stem
-        
-        
-        noisy = add_gaussian_noise(original, sigma=30)
-        noisy.save(os.path.join(output_dir, f"{name}_noisy.jpg"))
-        
-        
-        blurred = gaussian_blur(original, kernel_size=15, sigma=2.5)
-        blurred.save(os.path.join(output_dir, f"{name}_blurred.jpg"))
-        
-        
-        low_contrast = reduce_contrast(original, factor=0.4)
-        low_contrast.save(os.path.join(output_dir, f"{name}_low_contrast.jpg"))
-        
-        
-        dark = darken_image(original, factor=0.3)
-        dark.save(os.path.join(output_dir, f"{name}_dark.jpg"))
-        
-        
-        over = overexpose_image(original, factor=2.0)
-        over.save(os.path.join(output_dir, f"{name}_overexposed.jpg"))
-        
-        print(f"✅ Апрацавана: {name}")
+        t0 = time.perf_counter()
+        with open(input_path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            data = f.read()
+        source_hash = file_sha256(data)
+        stats["source"] = source_record(stat, source_hash)
+
+        pending = []
+        for suffix, func, params in DEGRADATIONS:
+            fname = output_name(name, suffix)
+            expected = output_entry(source_hash, suffix, params)
+            if output_is_current(previous.get(fname), expected, os.path.join(output_dir, fname)):
+                stats["outputs"][fname] = expected
+                stats["skipped"] += 1
+            else:
+                pending.append((fname, expected, func, params))
+
+        if pending:
+            with Image.open(io.BytesIO(data)) as img:
+                original = np.asarray(img.convert('RGB'))
+            stats["pixels"] = original.shape[0] * original.shape[1]
+        stats["decode"] = time.perf_counter() - t0
+
+        for fname, expected, func, params in pending:
+            t0 = time.perf_counter()
+            if func is gaussian_blur:
+                result = func(original, buffer=_worker_blur_buffer(original.shape), **params)
+            else:
+                result = func(original, **params)
+            t1 = time.perf_counter()
+            out_path = os.path.join(output_dir, fname)
+            result.save(out_path + ".tmp", format="JPEG")
+            os.replace(out_path + ".tmp", out_path)
+            stats["outputs"][fname] = expected
+            stats["degrade"] += t1 - t0
+            stats["encode"] += time.perf_counter() - t1
+
+        stats["ok"] = True
     except Exception as e:
-        print(f"❌ Памылка пры апрацоўцы {input_path}: {e}")
+        stats["error"] = str(e)
+    return stats
+
+def is_up_to_date(manifest, input_path, output_dir):
+    
+    # Cheap check with stat calls only: the source is unchanged since it was
+    # last hashed and all of its outputs are listed and present.
+    source_hash = cached_source_hash(manifest, input_path, os.stat(input_path))
+    if source_hash is None:
+        return False
+    name = Path(input_path).stem
+    for suffix, _, params in DEGRADATIONS:
+        fname = output_name(name, suffix)
+        expected = output_entry(source_hash, suffix, params)
+        if not output_is_current(manifest["outputs"].get(fname), expected,
+                                 os.path.join(output_dir, fname)):
+            return False
+    return True
+
+def previous_outputs(manifest, input_path):
+    
+    name = Path(input_path).stem
+    outputs = manifest["outputs"]
+    return {fname: outputs[fname]
+            for fname in (output_name(name, suffix) for suffix, _, _ in DEGRADATIONS)
+            if fname in outputs}
+
+def print_summary(results, elapsed):
+    
+    print(f"\n{'Выява':<40} {'МП':>6} {'Дэкад.':>8} {'Дэград.':>8} {'Кадз.':>8} {'Усяго':>8}")
+    for r in results:
+        total = r["decode"] + r["degrade"] + r["encode"]
+        print(f"{r['name'][:40]:<40} {r['pixels'] / 1e6:>6.1f} {r['decode']:>8.2f} "
+              f"{r['degrade']:>8.2f} {r['encode']:>8.2f} {total:>8.2f}")
+
+    done = [r for r in results if r["ok"]]
+    megapixels = sum(r["pixels"] for r in done) / 1e6
+    skipped = sum(r["skipped"] for r in results)
+    print(f"\nАпрацавана {len(done)} з {len(results)} выяў за {elapsed:.1f} с "
+          f"(актуальных файлаў прапушчана: {skipped})")
+    if elapsed > 0:
+        print(f"Прапускная здольнасць: {len(done) / elapsed:.2f} выяў/с, {megapixels / elapsed:.1f} МП/с")
+
+def parse_args():
+    
+    parser = argparse.ArgumentParser(description="Стварэнне тэставай базы сапсаваных выяў")
+    parser.add_argument("--input", default=INPUT_DIR, help="папка з арыгінальнымі выявамі")
+    parser.add_argument("--output", default=OUTPUT_DIR, help="папка для тэставай базы")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="колькасць працэсаў (1 - без пула)")
+    parser.add_argument("--chunksize", type=int, default=1,
+                        help="колькасць выяў, якія перадаюцца працэсу за раз")
+    parser.add_argument("--force", action="store_true",
+                        help="ігнараваць маніфест і стварыць усе файлы нанова")
+    return parser.parse_args()
 
 def main():
-    if not os.path.exists(INPUT_DIR):
-        print(f"Папка {INPUT_DIR} не існуе! Стварыце яе і дадайце выявы.")
+    args = parse_args()
+    if not os.path.exists(args.input):
+        print(f"Папка {args.input} не існуе! Стварыце яе і дадайце выявы.")
         return
+    Path(args.output).mkdir(exist_ok=True)
     
     image_files = []
     for ext in ["*.jpg", "*.jpeg", "*.png", "*.bmp"]:
-        image_files.extend(Path(INPUT_DIR).glob(ext))
+        image_files.extend(Path(args.input).glob(ext))
     
     if not image_files:
-        print(f"Няма выяў у {INPUT_DIR}! Дадайце файлы з пашырэннямі: jpg, png, bmp.")
+        print(f"Няма выяў у {args.input}! Дадайце файлы з пашырэннямі: jpg, png, bmp.")
         return
     
     print(f"Знойдзена {len(image_files)} выяў. Пачынаю стварэнне тэставай базы...")
     
-    for img_path in image_files:
-        process_image(str(img_path), OUTPUT_DIR)
+    manifest = empty_manifest() if args.force else load_manifest(args.output)
+    paths = []
+    for p in image_files:
+        if is_up_to_date(manifest, str(p), args.output):
+            continue
+        paths.append(str(p))
+    print(f"Актуальных выяў: {len(image_files) - len(paths)}, да апрацоўкі: {len(paths)}")
+    if not paths:
+        print(f"\n🎉 Тэставая база ў папцы {args.output} ужо актуальная")
+        return
+
+    previous = [previous_outputs(manifest, p) for p in paths]
+    start = time.perf_counter()
+    try:
+        if args.workers > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(max_workers=args.workers) as executor:
+                stream = executor.map(process_image, paths, repeat(args.output), previous,
+                                      chunksize=max(1, args.chunksize))
+                results = report_progress(stream, paths, manifest, args.output)
+        else:
+            stream = (process_image(p, args.output, prev) for p, prev in zip(paths, previous))
+            results = report_progress(stream, paths, manifest, args.output)
+    finally:
+        save_manifest(args.output, manifest)
+    elapsed = time.perf_counter() - start
+
+    print_summary(results, elapsed)
+    print(f"\n🎉 Гатова! Тэставая база захавана ў папку: {args.output}")
+
+def report_progress(stream, paths, manifest, output_dir, save_interval=5.0):
     
-    print(f"\n🎉 Гатова! Тэставая база захавана ў папку: {OUTPUT_DIR}")
+    # Records every finished image in the manifest and flushes it to disk
+    # every `save_interval` seconds so a crash loses at most that much work.
+    results = []
+    last_save = time.perf_counter()
+    for path, stats in zip(paths, stream):
+        if stats["ok"]:
+            print(f"✅ Апрацавана: {stats['name']}")
+        else:
+            print(f"❌ Памылка пры апрацоўцы {path}: {stats['error']}")
+        if stats["source"] is not None:
+            manifest["sources"][path] = stats["source"]
+        manifest["outputs"].update(stats["outputs"])
+        results.append(stats)
+        if time.perf_counter() - last_save >= save_interval:
+            save_manifest(output_dir, manifest)
+            last_save = time.perf_counter()
+    return results
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+# Memory the cached stage results may take before the least recently used
+# ones are dropped.
+DEFAULT_MAX_BYTES = 512 * 2**20
+# Rough size of a Python object that is not an array (a Hough line, a float).
+OBJECT_BYTES = 64
+
+
+def value_size(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return OBJECT_BYTES + sum(value_size(item) for item in value)
+    return OBJECT_BYTES
+
+
+class StageCache:
+    # Intermediate results of the processing pipeline (contrast-enhanced
+    # image, edge magnitude, edge map, Hough accumulator, Harris response)
+    # keyed by (image key, stage, parameters of the stage and of everything
+    # upstream of it). Entries are kept in LRU order and evicted once their
+    # total size exceeds max_bytes; a result larger than the limit is not
+    # stored at all. Cached arrays are shared, so callers must not modify
+    # them. Jobs run on worker threads, hence the lock.
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, compute):
+        # The cached value for `key`, or compute() stored under it. compute()
+        # runs outside the lock, so a slow stage does not block other jobs.
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        size = value_size(value)
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (value, size)
+            self.bytes += size
+            self.evict()
+
+    def set_max_bytes(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            self.evict()
+
+    def evict(self):
+        while self.bytes > self.max_bytes and self.entries:
+            _, (_, size) = self.entries.popitem(last=False)
+            self.bytes -= size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+
+def cached(cache, image_key, stage_key, compute):
+    # compute() through `cache` when there is one and the image has a key.
+    if cache is None or image_key is None:
+        return compute()
+    return cache.get((image_key,) + stage_key, compute)
@@ -0,0 +1,498 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+
+import main
+from convolution import separable_convolve2d
+from stage_cache import cached
+
+
+# Tiled execution of the main.py pipeline for images too large to process in
+# one piece. The image is cut into bands of whole rows; each band is read
+# together with `halo` real rows above and below, where the halo covers the
+# footprint of every neighbourhood operation of the stage (Sobel, Gaussian,
+# maximum filter, ...), and only the band's own rows of the result are kept.
+# Rows missing at the image border are padded exactly as the whole-image
+# functions pad them, so every pixel is computed from the same inputs in the
+# same order and the result is identical to main.process_image.
+#
+# Values that depend on the whole image (min/max for contrast stretching and
+# magnitude normalization, histograms, the Harris maximum, hysteresis
+# components) are gathered in a first streaming pass over the bands.
+#
+# Besides the input, the only full-size arrays are the uint8 output and,
+# for edge-based stages, a uint8 edge map; everything float is band-sized.
+#
+# Bands can be processed by a thread pool: NumPy releases the GIL inside its
+# array loops, so the bands of a stage run on several cores at once. Every
+# band writes its rows straight into the preallocated output.
+
+# Pixels per band (rows x width), halo rows not included.
+TILE_PIXELS = 1 << 20
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+
+def band_rows(shape, tile_pixels=TILE_PIXELS, workers=1):
+    # With several workers the bands are made small enough that each worker
+    # gets at least one; `tile_pixels=None` means no memory limit.
+    h, w = shape[:2]
+    rows = h if tile_pixels is None else tile_pixels // w
+    return max(1, min(rows, -(-h // workers)))
+
+
+class BandScheduler:
+    # With `keep`, results of a first pass that the second pass needs again
+    # are kept per band instead of being recomputed (see band_max); meant
+    # for runs without a memory limit.
+    def __init__(self, height, rows, workers=1, keep=False):
+        self.height = height
+        self.rows = rows
+        self.executor = ThreadPoolExecutor(workers) if workers > 1 else None
+        self.keep = keep
+        self.saved = {}
+        self.progress = None
+        self.passes = 1
+        self.passes_done = 0
+
+    def __iter__(self):
+        for r0 in range(0, self.height, self.rows):
+            yield r0, min(self.height, r0 + self.rows)
+
+    def stage(self, progress, passes):
+        # The next `passes` calls of map() make up one stage; `progress` gets
+        # the stage's fraction done after every band and may raise (e.g.
+        # main.Cancelled), which cancels the bands not started yet.
+        self.progress = progress
+        self.passes = passes
+        self.passes_done = 0
+
+    def map(self, func):
+        # func(r0, r1) for every band; the results in band order.
+        bands = list(self)
+        results = [None] * len(bands)
+        if self.executor is None:
+            for i, (r0, r1) in enumerate(bands):
+                results[i] = func(r0, r1)
+                self.band_done(i + 1, len(bands))
+        else:
+            futures = {self.executor.submit(func, r0, r1): i for i, (r0, r1) in enumerate(bands)}
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    results[futures[future]] = future.result()
+                    self.band_done(done, len(bands))
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        self.passes_done += 1
+        return results
+
+    def band_done(self, done, total):
+        if self.progress is not None:
+            self.progress(min(1.0, (self.passes_done + done / total) / self.passes))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_band(img, r0, r1, halo):
+    # Rows [r0, r1) with up to `halo` neighbouring rows on each side, and the
+    # slice of the result that belongs to [r0, r1).
+    top = max(0, r0 - halo)
+    bottom = min(len(img), r1 + halo)
+    return img[top:bottom], slice(r0 - top, r1 - top)
+
+
+def band_max(img, bands, halo, func, key=None):
+    # Maximum of key(func(band)) over the bands' own rows; `key` picks the
+    # array from a tuple result. band_result() gives func's result for the
+    # same band and halo again in the second pass.
+    def band(r0, r1):
+        region, inner = read_band(img, r0, r1, halo)
+        result = func(region)
+        if bands.keep:
+            bands.saved[r0] = result
+        return (key(result) if key else result)[inner].max()
+    return max(bands.map(band))
+
+
+def band_result(img, bands, r0, r1, halo, func):
+    region, inner = read_band(img, r0, r1, halo)
+    result = bands.saved.pop(r0, None)
+    return (func(region) if result is None else result), inner
+
+
+# Contrast
+
+def linear_contrast_tiled(img, out, bands, progress=None):
+    bands.stage(progress, 2)
+    parts = bands.map(lambda r0, r1: main.channel_bounds(img[r0:r1]))
+    bounds = [(min(lo for lo, _ in channel), max(hi for _, hi in channel)) for channel in zip(*parts)]
+
+    def band(r0, r1):
+        out[r0:r1] = main.linear_contrast(img[r0:r1], bounds)
+    bands.map(band)
+
+
+def histograms(img, bands, func):
+    # Sum of main.gray_histogram over the channels `func` returns for each band.
+    parts = bands.map(lambda r0, r1: [main.gray_histogram(channel) for channel in func(img[r0:r1])])
+    return [sum(hists) for hists in zip(*parts)]
+
+
+def hist_equalize_grayscale_tiled(img, out, bands, progress=None):
+    bands.stage(progress, 2)
+    lut = main.histogram_lut(histograms(img, bands, lambda band: [main.grayscale(band)])[0])
+
+    def band(r0, r1):
+        out[r0:r1] = lut[main.grayscale(img[r0:r1])][:, :, np.newaxis]
+    bands.map(band)
+
+
+def hist_equalize_rgb_tiled(img, out, bands, progress=None):
+    bands.stage(progress, 2)
+    hists = histograms(img, bands, lambda band: [band[:, :, c] for c in range(3)])
+    luts = [main.histogram_lut(hist) for hist in hists]
+
+    def band(r0, r1):
+        for c in range(3):
+            out[r0:r1, :, c] = luts[c][img[r0:r1, :, c]]
+    bands.map(band)
+
+
+def hist_equalize_hsv_tiled(img, out, bands, progress=None):
+    bands.stage(progress, 2)
+    lut = main.histogram_lut(histograms(img, bands, lambda band: [band.max(axis=2)])[0])
+
+    def band(r0, r1):
+        out[r0:r1] = main.hist_equalize_hsv(img[r0:r1], lut)
+    bands.map(band)
+
+
+# Edges
+
+def sobel_magnitude(band):
+    return np.hypot(*main.sobel_gradients(main.grayscale(band)))
+
+
+def detect_edges_tiled(img, bands, low=50, high=150, use_hysteresis=True, progress=None):
+    edges = edge_magnitude_tiled(img, bands, main.progress_range(progress, 0, 0.7))
+    threshold_edges(edges, bands, low, high, use_hysteresis, main.progress_range(progress, 0.7, 1))
+    return edges
+
+
+def edge_magnitude_tiled(img, bands, progress=None):
+    bands.stage(progress, 2)
+    peak = band_max(img, bands, 1, sobel_magnitude)
+    edges = np.empty(img.shape[:2], dtype=np.uint8)
+
+    def band(r0, r1):
+        mag, inner = band_result(img, bands, r0, r1, 1, sobel_magnitude)
+        edges[r0:r1] = main.normalize_magnitude(mag[inner], peak)
+    bands.map(band)
+    return edges
+
+
+def canny_edges_tiled(img, bands, low=30, high=90, sigma=1.4, progress=None):
+    edges = canny_nms_tiled(img, bands, sigma, main.progress_range(progress, 0, 0.8))
+    threshold_edges(edges, bands, low, high, True, main.progress_range(progress, 0.8, 1))
+    return edges
+
+
+def canny_nms_tiled(img, bands, sigma=1.4, progress=None):
+    bands.stage(progress, 2)
+    radius = max(1, int(np.ceil(3 * sigma)))
+    ax = np.arange(-radius, radius + 1, dtype=np.float64)
+    kernel = np.exp(-ax**2 / (2 * sigma**2))
+    kernel /= np.sum(kernel)
+
+    def gradients(region):
+        smoothed = separable_convolve2d(main.grayscale(region), kernel, kernel, mode='edge')
+        Gx, Gy = main.sobel_gradients(smoothed, mode='edge')
+        return Gx, Gy, np.hypot(Gx, Gy)
+
+    # The Gaussian needs `radius` rows, Sobel one more and non-maximum
+    # suppression one more on top of that.
+    halo = radius + 2
+    peak = band_max(img, bands, halo, gradients, key=lambda result: result[2])
+    edges = np.empty(img.shape[:2], dtype=np.uint8)
+
+    def band(r0, r1):
+        (Gx, Gy, mag), inner = band_result(img, bands, r0, r1, halo, gradients)
+        mag = main.normalize_magnitude(mag, peak)
+        edges[r0:r1] = main.non_maximum_suppression(mag, Gx, Gy)[inner]
+    bands.map(band)
+    return edges
+
+
+def threshold_edges(edges, bands, low, high, use_hysteresis=True, progress=None):
+    # Replaces the magnitudes in `edges` by the 0/255 edge map.
+    if use_hysteresis and low < high:
+        bands.stage(progress, 2)
+        hysteresis_tiled(edges, bands, low, high)
+        return
+
+    bands.stage(progress, 1)
+
+    def band(r0, r1):
+        edges[r0:r1] = np.where(edges[r0:r1] >= min(low, high), 255, 0)
+    bands.map(band)
+
+
+def hysteresis_tiled(edges, bands, low, high):
+    # main.hysteresis_threshold over bands. Every band is labelled on its
+    # own; labels get a global offset, and labels touching across a seam
+    # (8-connected, so also diagonally) are joined with connected_components
+    # on the label graph. A second pass relabels each band and keeps the
+    # labels whose joined component has a pixel >= high. Memory is set by the
+    # band size and the number of labels, not the image size.
+    from scipy.ndimage import label
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    structure = np.ones((3, 3), dtype=bool)
+    w = edges.shape[1]
+
+    def band_labels(r0, r1):
+        return label(edges[r0:r1] >= low, structure=structure)
+
+    def first_pass(r0, r1):
+        labels, num = band_labels(r0, r1)
+        strong = np.unique(labels[edges[r0:r1] >= high])
+        return num, strong, labels[0].copy(), labels[-1].copy()
+
+    parts = bands.map(first_pass)
+    nums = [num for num, _, _, _ in parts]
+    offsets = np.concatenate(([0], np.cumsum(nums)[:-1])).astype(np.int64)
+    count = int(sum(nums))
+
+    def shifted(labels, offset):
+        labels = labels.astype(np.int64)
+        labels[labels > 0] += offset
+        return labels
+
+    links = []
+    for (_, _, _, last), (_, _, first, _), top, bottom in zip(parts, parts[1:], offsets, offsets[1:]):
+        above, below = shifted(last, top), shifted(first, bottom)
+        for dx in (-1, 0, 1):
+            a = above[max(0, -dx):w - max(0, dx)]
+            b = below[max(0, dx):w - max(0, -dx)]
+            touching = (a > 0) & (b > 0)
+            links.append((a[touching], b[touching]))
+
+    keep = np.zeros(count + 1, dtype=np.uint8)
+    if count:
+        a = np.concatenate([pair[0] for pair in links] or [np.zeros(0, np.int64)])
+        b = np.concatenate([pair[1] for pair in links] or [np.zeros(0, np.int64)])
+        graph = coo_matrix((np.ones(len(a), dtype=np.int8), (a, b)), shape=(count + 1, count + 1))
+        _, component = connected_components(graph, directed=False)
+        strong = np.concatenate([shifted(s, offset) for (_, s, _, _), offset in zip(parts, offsets)])
+        has_strong = np.zeros(component.max() + 1, dtype=bool)
+        has_strong[component[strong]] = True
+        keep[has_strong[component]] = 255
+    keep[0] = 0
+
+    offset_of = dict(zip((r0 for r0, _ in bands), offsets))
+
+    def second_pass(r0, r1):
+        labels, _ = band_labels(r0, r1)
+        edges[r0:r1] = keep[shifted(labels, offset_of[r0])]
+    bands.map(second_pass)
+
+
+def overlay_edges_tiled(out, edges, bands, progress=None):
+    bands.stage(progress, 1)
+    def band(r0, r1):
+        out[r0:r1][edges[r0:r1] == 255] = [0, 0, 255]
+    bands.map(band)
+
+
+# Lines and points
+
+def hough_accumulator_tiled(edges, bands, angle_step=1, chunk_size=4096, progress=None):
+    # Each worker thread votes into its own accumulator; they are summed at
+    # the end, so the counts are exact.
+    thetas, rhos = main.hough_axes(edges.shape, angle_step)
+    size = len(rhos) * len(thetas)
+    bands.stage(progress, 1)
+    local = threading.local()
+    accumulators = []
+    lock = threading.Lock()
+
+    def band(r0, r1):
+        if not hasattr(local, 'accumulator'):
+            local.accumulator = np.zeros(size, dtype=np.int64)
+            with lock:
+                accumulators.append(local.accumulator)
+        y_idxs, x_idxs = np.nonzero(edges[r0:r1])
+        main.hough_vote(local.accumulator, thetas, rhos, y_idxs + r0, x_idxs, chunk_size)
+    bands.map(band)
+
+    accumulator = accumulators[0]
+    for other in accumulators[1:]:
+        accumulator += other
+    return thetas, rhos, accumulator.reshape(len(rhos), len(thetas)).astype(np.int32)
+
+
+def harris_response_tiled(img, bands, k=0.04, progress=None):
+    # The full-size response, for when it is kept (e.g. cached) between
+    # runs; harris_corner_tiled never holds more than a band of it.
+    bands.stage(progress, 1)
+    R = np.empty(img.shape[:2], dtype=np.float32)
+
+    def band(r0, r1):
+        region, inner = read_band(img, r0, r1, 3)
+        R[r0:r1] = main.harris_response(region, k)[inner]
+    bands.map(band)
+    return R
+
+
+def harris_peaks_tiled(R, bands, threshold=0.01, min_distance=10, progress=None):
+    # Corner coordinates from a full-size response, see harris_corner_tiled.
+    bands.stage(progress, 2)
+    peak = band_max(R, bands, 0, lambda region: region)
+    halo = max(0, min_distance) // 2
+
+    def band(r0, r1):
+        region, inner = read_band(R, r0, r1, halo)
+        y_idxs, x_idxs = np.nonzero(main.harris_peaks(region, threshold, min_distance, peak)[inner])
+        return y_idxs + r0, x_idxs
+    parts = bands.map(band)
+    return np.concatenate([y for y, _ in parts]), np.concatenate([x for _, x in parts])
+
+
+def harris_corner_tiled(img, bands, k=0.04, threshold=0.01, min_distance=10, progress=None):
+    # Returns the (y, x) coordinates of the corners. The response needs three
+    # halo rows (central difference plus the 5x5 Gaussian), the maximum
+    # filter another min_distance // 2.
+    bands.stage(progress, 2)
+    halo = 3 + max(0, min_distance) // 2
+    response = lambda region: main.harris_response(region, k)
+    peak = band_max(img, bands, halo, response)
+
+    def band(r0, r1):
+        R, inner = band_result(img, bands, r0, r1, halo, response)
+        corners = main.harris_peaks(R, threshold, min_distance, peak)
+        y_idxs, x_idxs = np.nonzero(corners[inner])
+        return y_idxs + r0, x_idxs
+    parts = bands.map(band)
+    return np.concatenate([y for y, _ in parts]), np.concatenate([x for _, x in parts])
+
+
+def process_image_tiled(original, params, tile_pixels=TILE_PIXELS, workers=1, progress=None,
+                        cache=None, image_key=None):
+    # Same pipeline and result as main.process_image, including the
+    # `progress` callback, which here is also called after every band, and
+    # the stage cache, whose entries the two share. With a tile size the
+    # cache is not used: it keeps full-size arrays, which is what the
+    # memory-bounded mode avoids.
+    if tile_pixels is not None:
+        cache = None
+    rows = band_rows(original.shape, tile_pixels, workers)
+    with BandScheduler(len(original), rows, workers, keep=tile_pixels is None) as bands:
+        return run_pipeline(original, params, bands, progress, cache, image_key)
+
+
+CONTRAST_STAGES = {
+    "Лінейнае пашырэнне кантрасту": linear_contrast_tiled,
+    "Эквалізацыя гістаграмы (адценні шэрага)": hist_equalize_grayscale_tiled,
+    "Эквалізацыя гістаграмы (RGB)": hist_equalize_rgb_tiled,
+    "Эквалізацыя гістаграмы (HSV)": hist_equalize_hsv_tiled,
+}
+
+
+def run_pipeline(original, params, bands, progress=None, cache=None, image_key=None):
+    contrast = params['contrast']
+    segment = params['segment']
+    stage = lambda start, end: main.progress_range(progress, start, end)
+    report = progress or (lambda fraction: None)
+    # Cached arrays are shared: stages that work in place get a copy.
+    caching = cache is not None and image_key is not None
+    run = lambda key, compute: cached(cache, image_key, key, compute)
+
+    def contrast_image():
+        out = np.empty_like(original)
+        CONTRAST_STAGES[contrast](original, out, bands, stage(0, 0.1))
+        return out
+
+    img = run(('contrast', contrast), contrast_image) if contrast in CONTRAST_STAGES else original
+    report(0.1)
+    # Lines, edges and corners are painted into this copy in place.
+    result = img if img is not original and not caching else img.copy()
+
+    def thresholded(source, low, high, use_hysteresis, progress):
+        edges = source.copy() if caching else source
+        threshold_edges(edges, bands, low, high, use_hysteresis, progress)
+        return edges
+
+    def edges_for(low, high, use_hysteresis, progress):
+        magnitude = lambda: run(('sobel', contrast),
+                                lambda: edge_magnitude_tiled(img, bands, main.progress_range(progress, 0, 0.7)))
+        return run(('edges', contrast, low, high, use_hysteresis),
+                   lambda: thresholded(magnitude(), low, high, use_hysteresis,
+                                       main.progress_range(progress, 0.7, 1)))
+
+    def canny_for(low, high, sigma, progress):
+        thin = lambda: run(('canny', contrast, sigma),
+                           lambda: canny_nms_tiled(img, bands, sigma, main.progress_range(progress, 0, 0.8)))
+        return run(('canny_edges', contrast, sigma, low, high),
+                   lambda: thresholded(thin(), low, high, True, main.progress_range(progress, 0.8, 1)))
+
+    if segment == "Перапады яркасці":
+        edges = edges_for(params['edge_low'], params['edge_high'], params['edge_hysteresis'],
+                          stage(0.1, 0.9))
+        overlay_edges_tiled(result, edges, bands, stage(0.9, 1))
+    elif segment == "Дэтэктар Кэні":
+        edges = canny_for(params['canny_low'], params['canny_high'], params['canny_sigma'],
+                          stage(0.1, 0.9))
+        overlay_edges_tiled(result, edges, bands, stage(0.9, 1))
+    elif segment == "Выяўленне ліній":
+        if params['line_canny']:
+            edges = canny_for(30, 90, params['line_canny_sigma'], stage(0.1, 0.4))
+            edge_key = ('canny_edges', contrast, params['line_canny_sigma'], 30, 90)
+        else:
+            edges = edges_for(50, 150, True, stage(0.1, 0.4))
+            edge_key = ('edges', contrast, 50, 150, True)
+        if params['line_probabilistic']:
+            # The progressive transform visits edge pixels in random order
+            # over the whole image, so it runs on the full uint8 edge map.
+            segments = main.probabilistic_hough_line(
+                edges,
+                threshold=params['line_threshold'],
+                min_line_length=params['line_min_length'],
+                max_line_gap=params['line_max_gap'],
+                angle_step=params['line_angle_step'],
+                progress=stage(0.4, 0.95)
+            )
+        else:
+            thetas, rhos, accumulator = run(
+                edge_key + ('hough', params['line_angle_step']),
+                lambda: hough_accumulator_tiled(edges, bands, params['line_angle_step'],
+                                                progress=stage(0.4, 0.95)))
+            lines = main.hough_peaks(accumulator, rhos, thetas, params['line_threshold'])
+            segments = main.line_segments(lines, params['line_min_length'])
+        del edges
+        main.paint_segments(result, segments)
+    elif segment == "Выяўленне кропак":
+        if bands.keep:
+            # No memory limit: keep the full response so that changing only
+            # the threshold or distance reuses it.
+            R = run(('harris', contrast), lambda: harris_response_tiled(img, bands, progress=stage(0.1, 0.7)))
+            y_idxs, x_idxs = harris_peaks_tiled(R, bands, params['point_threshold'],
+                                                params['point_min_distance'], stage(0.7, 0.95))
+        else:
+            y_idxs, x_idxs = harris_corner_tiled(img, bands, threshold=params['point_threshold'],
+                                                 min_distance=params['point_min_distance'],
+                                                 progress=stage(0.1, 0.95))
+        main.paint_points(result, y_idxs, x_idxs)
+
+    report(1.0)
+    return result